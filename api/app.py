@@ -1,16 +1,39 @@
 import os
+import sys
 import json
 import uuid
+import hashlib
 import secrets
 import re
-from flask import Flask, request, jsonify
+import importlib
+import time
+import threading
+import unicodedata
+from urllib.parse import quote
+from flask import Flask, request, jsonify, Response, send_file
 from flask_cors import CORS
-import yt_dlp
 from datetime import timedelta
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+
+# The API modules import each other as top-level modules. Hosts that load this file by
+# path from the project root (like @vercel/python) don't put api/ on sys.path, so add it.
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+import net
+import state
+import subtitles
+import audio
+import segments
+import tracing
 
 app = Flask(__name__)
-CORS(app)  # Enable CORS for all routes
+CORS(app, expose_headers=[tracing.REQUEST_ID_HEADER])  # Enable CORS for all routes
+
+# Cache DNS lookups for all upstream traffic, including yt-dlp's own requests
+net.install_dns_cache()
 
 # Generate a secure API key if not already set
 API_KEY = os.environ.get('VIDEO_DOWNLOADER_API_KEY')
@@ -20,17 +43,25 @@ if not API_KEY:
     print(f"\n[INFO] Generated new API key: {API_KEY}")
     print("[INFO] You should set this as an environment variable 'VIDEO_DOWNLOADER_API_KEY' for production use.\n")
 
+# Function to check the request's API key
+def has_valid_api_key():
+    provided_key = request.headers.get('X-API-Key')
+    return bool(provided_key) and provided_key == API_KEY
+
 # API key authentication decorator
 def require_api_key(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        provided_key = request.headers.get('X-API-Key')
-        if provided_key and provided_key == API_KEY:
+        if has_valid_api_key():
             return f(*args, **kwargs)
         else:
             return jsonify({"error": "Unauthorized: Invalid or missing API key"}), 401
     return decorated_function
 
+# Request ids, span logs and sampling profiles; see tracing.py.
+# Only callers with a valid API key can turn tracing or profiling on per request.
+tracing.install(app, authorize=has_valid_api_key)
+
 # Function to detect platform from URL
 def detect_platform(url):
     url = url.lower()
@@ -95,57 +126,382 @@ def get_platform_options(platform, url):
 
     return options
 
-# Function to extract video info using yt-dlp with enhanced platform support
+# yt-dlp is imported on first use so that cold starts (serverless, gunicorn
+# worker boot) and the static endpoints don't pay for loading it
+_yt_dlp = None
+_yt_dlp_lock = threading.Lock()
+
+# yt-dlp extractor modules backing each supported platform
+PLATFORM_EXTRACTOR_MODULES = {
+    'youtube': ['youtube'],
+    'tiktok': ['tiktok'],
+    'instagram': ['instagram'],
+    'facebook': ['facebook'],
+    'twitter': ['twitter'],
+    'vimeo': ['vimeo'],
+    'reddit': ['reddit'],
+    'dailymotion': ['dailymotion'],
+    'twitch': ['twitch'],
+    'soundcloud': ['soundcloud'],
+}
+
+# Function to import yt-dlp on first use
+def load_yt_dlp():
+    global _yt_dlp
+    if _yt_dlp is None:
+        with _yt_dlp_lock:
+            if _yt_dlp is None:
+                import yt_dlp
+                _yt_dlp = yt_dlp
+    return _yt_dlp
+
+# Function to import yt-dlp and the extractors for the given platforms ahead of the first request
+def preload_extractors(platforms):
+    load_yt_dlp()
+    for platform in platforms:
+        for module in PLATFORM_EXTRACTOR_MODULES.get(platform, []):
+            try:
+                importlib.import_module(f'yt_dlp.extractor.{module}')
+            except ImportError as e:
+                print(f"[WARNING] Could not preload extractor '{module}': {e}")
+
+# Pool of idle YoutubeDL instances per platform. Reusing an instance keeps its
+# request handlers (and their keep-alive connections) open between extractions.
+YDL_POOL_SIZE = int(os.environ.get('YDL_POOL_SIZE', 4))
+_ydl_pool = {}
+_ydl_pool_lock = threading.Lock()
+
+# Function to check out a YoutubeDL instance for a platform
+def acquire_ydl(platform, video_url):
+    with _ydl_pool_lock:
+        idle = _ydl_pool.get(platform)
+        if idle:
+            return idle.pop()
+    return tracing.instrument_ydl(load_yt_dlp().YoutubeDL(get_platform_options(platform, video_url)))
+
+# Function to return a YoutubeDL instance to the pool
+def release_ydl(platform, ydl):
+    with _ydl_pool_lock:
+        idle = _ydl_pool.setdefault(platform, [])
+        if len(idle) < YDL_POOL_SIZE:
+            idle.append(ydl)
+            return
+    ydl.close()
+
+# Shared state (caches, locks, job results, rate limits); see state.py
+state_backend = state.create_backend(state.STATE_BACKEND_URL)
+
+# Successful extractions are cached briefly, since format URLs expire upstream
+EXTRACTION_CACHE_TTL = int(os.environ.get('EXTRACTION_CACHE_TTL', 300))
+EXTRACTION_LOCK_TTL = int(os.environ.get('EXTRACTION_LOCK_TTL', 120))
+EXTRACTION_WAIT_TIMEOUT = float(os.environ.get('EXTRACTION_WAIT_TIMEOUT', 60))
+EXTRACTION_POLL_INTERVAL = 0.2
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 86400))
+
+# Fleet-wide budget of extractions per platform per minute (0 disables it)
+UPSTREAM_RATE_LIMIT_PER_MINUTE = int(os.environ.get('UPSTREAM_RATE_LIMIT_PER_MINUTE', 0))
+
+# Negative cache for failed extractions (private, deleted, region-blocked videos).
+# Each error class gets its own TTL so transient network failures are retried soon
+# while permanently unavailable content is not re-extracted on every request.
+NEGATIVE_CACHE_TTLS = {
+    'transient': int(os.environ.get('NEGATIVE_CACHE_TTL_TRANSIENT', 30)),
+    'generic': int(os.environ.get('NEGATIVE_CACHE_TTL_GENERIC', 300)),
+    'geo_restricted': int(os.environ.get('NEGATIVE_CACHE_TTL_GEO', 3600)),
+    'private': int(os.environ.get('NEGATIVE_CACHE_TTL_PRIVATE', 3600)),
+    'removed': int(os.environ.get('NEGATIVE_CACHE_TTL_REMOVED', 21600)),
+}
+
+# Substrings (lowercase) used to classify yt-dlp error messages when the wrapped
+# exception doesn't settle it, checked in order. Specific phrasings come before the
+# broad "unavailable"/"not found" ones, which YouTube also prefixes to geo and private errors.
+NEGATIVE_CACHE_PATTERNS = [
+    ('transient', ['timed out', 'timeout', 'temporarily', 'too many requests', 'http error 429',
+                   'http error 5', 'connection reset', 'connection refused', 'connection aborted',
+                   'name or service not known', 'temporary failure in name resolution',
+                   'network is unreachable', "confirm you're not a bot", 'confirm you are not a bot',
+                   'rate-limit', 'rate limit', 'try again later']),
+    ('geo_restricted', ['available in your country', 'geo restrict', 'geo-restrict', 'region',
+                        'blocked it in your country']),
+    ('private', ['private', 'login', 'log in', 'sign in', 'requires authentication',
+                 'members-only', 'members only']),
+    ('removed', ['removed', 'deleted', 'no longer available', 'does not exist', 'video unavailable',
+                 'http error 404', 'http error 410', 'not found']),
+]
+
+# Function to classify the exception wrapped by a yt-dlp DownloadError (None if it doesn't tell)
+def classify_exception(exception):
+    yt_dlp = load_yt_dlp()
+    if isinstance(exception, yt_dlp.utils.GeoRestrictedError):
+        return 'geo_restricted'
+
+    cause = exception
+    if isinstance(exception, yt_dlp.utils.ExtractorError):
+        cause = exception.cause or exception.exc_info[1]
+    if isinstance(cause, yt_dlp.networking.exceptions.HTTPError):
+        if cause.status in (404, 410):
+            return 'removed'
+        if cause.status == 429 or cause.status >= 500:
+            return 'transient'
+        # Other statuses (e.g. 403) can mean private, geo-blocked or bot-checked
+        return None
+    if isinstance(cause, yt_dlp.networking.exceptions.TransportError):
+        return 'transient'
+
+    # Unexpected extractor errors are usually site changes, not a property of the video
+    if isinstance(exception, yt_dlp.utils.ExtractorError) and not exception.expected:
+        return 'generic'
+    return None
+
+# Function to classify an extraction error for negative caching
+def classify_error(error_message, exception=None):
+    if exception is not None:
+        error_class = classify_exception(exception)
+        if error_class is not None:
+            return error_class
+
+    message = error_message.lower()
+    for error_class, patterns in NEGATIVE_CACHE_PATTERNS:
+        if any(pattern in message for pattern in patterns):
+            return error_class
+    return 'generic'
+
+# Function to normalize a URL into a cache key
+def cache_key(video_url):
+    return video_url.strip()
+
+# Function to report a state backend failure. Caches, locks and budgets are only an
+# optimization, so callers carry on without them instead of failing the request.
+def warn_backend_error(action, error):
+    print(f"[WARNING] {action.capitalize()}: {error}")
+
+# Function to read a cache entry, treating a backend failure as a miss
+def cache_get(name):
+    try:
+        return state_backend.get(name)
+    except state.StateBackendError as e:
+        warn_backend_error('skipping cache lookup', e)
+        return None
+
+# Function to write a cache entry, skipping it if the backend fails
+def cache_set(name, value, ttl):
+    try:
+        state_backend.set(name, value, ttl)
+    except state.StateBackendError as e:
+        warn_backend_error('not caching result', e)
+
+# Function to look up a cached extraction error. count_hit is False for the repeat
+# lookups of a request waiting on another extraction, so each request counts once.
+def get_cached_error(video_url, count_hit=True):
+    key = cache_key(video_url)
+    entry = cache_get('negative:' + key)
+    if entry is None:
+        return None
+    if count_hit:
+        try:
+            state_backend.incr('negative-hits:' + key, NEGATIVE_CACHE_TTLS[entry['error_class']])
+        except state.StateBackendError as e:
+            warn_backend_error('not counting negative cache hit', e)
+    return dict(entry['result'])
+
+# Function to store an extraction error in the negative cache
+def cache_error(video_url, result, exception=None):
+    error_class = classify_error(result.get('original_error', result.get('error', '')), exception)
+    ttl = NEGATIVE_CACHE_TTLS[error_class]
+    if ttl <= 0:
+        return
+    key = cache_key(video_url)
+    try:
+        state_backend.delete('negative-hits:' + key)
+        state_backend.set('negative:' + key, {
+            'result': result,
+            'error_class': error_class,
+            'created_at': time.time(),
+        }, ttl)
+    except state.StateBackendError as e:
+        warn_backend_error('not caching error', e)
+
+# Function to list the live negative cache entries
+def get_negative_cache_entries():
+    now = time.time()
+    entries = []
+    for name in state_backend.scan('negative:'):
+        key = name[len('negative:'):]
+        entry = state_backend.get(name)
+        if entry is None:
+            continue
+        entries.append({
+            "url": key,
+            "platform": entry['result'].get('platform'),
+            "error_class": entry['error_class'],
+            "error": entry['result'].get('error'),
+            "hits": state_backend.get('negative-hits:' + key) or 0,
+            "age": round(now - entry['created_at'], 1),
+            "expires_in": round(state_backend.ttl(name) or 0, 1),
+        })
+    return entries
+
+# Function to clear the negative cache
+def clear_negative_cache():
+    names = state_backend.scan('negative:') + state_backend.scan('negative-hits:')
+    for name in names:
+        state_backend.delete(name)
+    return len([name for name in names if name.startswith('negative:')])
+
+# Function to look up a cached extraction result (successful or failed)
+def get_cached_info(video_url, count_hit=True):
+    info = cache_get('info:' + cache_key(video_url))
+    if info is not None:
+        return info
+    return get_cached_error(video_url, count_hit)
+
+# Function to count an extraction against the platform's fleet-wide budget.
+# Returns the number of seconds to wait if the budget is exhausted.
+def check_upstream_budget(platform):
+    if UPSTREAM_RATE_LIMIT_PER_MINUTE <= 0:
+        return None
+    now = time.time()
+    try:
+        count = state_backend.incr(f'ratelimit:{platform}:{int(now // 60)}', 60)
+    except state.StateBackendError as e:
+        warn_backend_error('skipping rate limit', e)
+        return None
+    if count > UPSTREAM_RATE_LIMIT_PER_MINUTE:
+        return int(60 - now % 60) + 1
+    return None
+
+# Function to take the single-flight extraction lock for a URL. Returns (acquired, token);
+# if the backend fails the extraction goes ahead without a lock (token None).
+def acquire_extraction_lock(key):
+    try:
+        token = state_backend.acquire_lock('extract:' + key, EXTRACTION_LOCK_TTL)
+    except state.StateBackendError as e:
+        warn_backend_error('extracting without lock', e)
+        return True, None
+    return token is not None, token
+
+# Function to release the single-flight extraction lock
+def release_extraction_lock(key, token):
+    if token is None:
+        return
+    try:
+        state_backend.release_lock('extract:' + key, token)
+    except state.StateBackendError as e:
+        warn_backend_error('lock will expire on its own', e)
+
+# Function to store a background job's state
+def save_job(job):
+    state_backend.set('job:' + job['id'], job, JOB_RESULT_TTL)
+
+# Function to load a background job's state
+def load_job(job_id):
+    return state_backend.get('job:' + job_id)
+
+# Function to extract video info using yt-dlp with enhanced platform support.
+# Results are cached in the shared state backend, and concurrent requests for the
+# same URL (on any node) wait for a single extraction instead of repeating it.
 def get_video_info(video_url):
     # Detect platform
     platform = detect_platform(video_url)
+    key = cache_key(video_url)
+
+    # Serve repeat requests (including repeat failures) from the cache
+    with tracing.span('cache.lookup') as fields:
+        cached = get_cached_info(video_url)
+        fields['hit'] = cached is not None
+    if cached is not None:
+        return cached
 
-    # Get platform-specific options
-    ydl_opts = get_platform_options(platform, video_url)
+    # Wait for an in-flight extraction of the same URL instead of starting another one
+    deadline = time.time() + EXTRACTION_WAIT_TIMEOUT
+    acquired, token = acquire_extraction_lock(key)
+    while not acquired and time.time() < deadline:
+        time.sleep(EXTRACTION_POLL_INTERVAL)
+        cached = get_cached_info(video_url, count_hit=False)
+        if cached is not None:
+            return cached
+        acquired, token = acquire_extraction_lock(key)
 
     try:
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(video_url, download=False)
-            # Add platform information to the result
-            info['platform'] = platform
-            return info
-    except yt_dlp.utils.DownloadError as e:
-        error_message = str(e)
+        # Another request may have finished the extraction while we took the lock
+        cached = get_cached_info(video_url, count_hit=False)
+        if cached is not None:
+            return cached
 
-        # Provide more user-friendly error messages based on platform
-        if platform == 'tiktok' and 'Unable to download webpage' in error_message:
-            return {
-                "error": "Could not download this TikTok video. This might be due to TikTok's restrictions or the video being private.",
-                "platform": platform,
-                "original_error": error_message,
-                "suggestions": [
-                    "Make sure the TikTok video is public and not deleted",
-                    "Try using the share link directly from the TikTok app",
-                    "Some TikTok videos may be region-restricted"
-                ]
-            }
-        elif platform == 'instagram' and 'login' in error_message.lower():
-            return {
-                "error": "This Instagram content requires login. The API cannot access private or login-required content.",
-                "platform": platform,
-                "original_error": error_message,
-                "suggestions": [
-                    "Make sure the Instagram content is public",
-                    "Try using a different link from Instagram"
-                ]
-            }
-        else:
+        retry_after = check_upstream_budget(platform)
+        if retry_after is not None:
             return {
-                "error": f"Could not download from {platform.capitalize()}: {error_message}",
+                "error": f"Too many requests to {platform.capitalize()}. Please retry in {retry_after} seconds.",
                 "platform": platform,
-                "original_error": error_message
+                "retry_after": retry_after
             }
+
+        return extract_video_info(video_url, platform)
+    finally:
+        release_extraction_lock(key, token)
+
+# Function to run yt-dlp for a URL and cache the outcome
+def extract_video_info(video_url, platform):
+    # Get a pooled YoutubeDL instance with platform-specific options
+    yt_dlp = load_yt_dlp()
+    ydl = acquire_ydl(platform, video_url)
+
+    try:
+        with tracing.span('ydl.extract', platform=platform) as fields:
+            info = ydl.extract_info(video_url, download=False)
+            fields['extractor'] = info.get('extractor')
+        info = ydl.sanitize_info(info)
+        release_ydl(platform, ydl)
+        # Add platform information to the result
+        info['platform'] = platform
+        if EXTRACTION_CACHE_TTL > 0:
+            cache_set('info:' + cache_key(video_url), info, EXTRACTION_CACHE_TTL)
+        return info
+    except yt_dlp.utils.DownloadError as e:
+        release_ydl(platform, ydl)
+        error_message = str(e)
+        result = build_error_response(platform, error_message)
+        cache_error(video_url, result, e.exc_info[1] if e.exc_info else None)
+        return result
     except Exception as e:
+        # Don't reuse an instance that failed unexpectedly
+        ydl.close()
         return {
             "error": f"An unexpected error occurred: {str(e)}",
             "platform": platform
         }
 
+# Function to build a user-friendly error response for a failed extraction
+def build_error_response(platform, error_message):
+    # Provide more user-friendly error messages based on platform
+    if platform == 'tiktok' and 'Unable to download webpage' in error_message:
+        return {
+            "error": "Could not download this TikTok video. This might be due to TikTok's restrictions or the video being private.",
+            "platform": platform,
+            "original_error": error_message,
+            "suggestions": [
+                "Make sure the TikTok video is public and not deleted",
+                "Try using the share link directly from the TikTok app",
+                "Some TikTok videos may be region-restricted"
+            ]
+        }
+    elif platform == 'instagram' and 'login' in error_message.lower():
+        return {
+            "error": "This Instagram content requires login. The API cannot access private or login-required content.",
+            "platform": platform,
+            "original_error": error_message,
+            "suggestions": [
+                "Make sure the Instagram content is public",
+                "Try using a different link from Instagram"
+            ]
+        }
+    else:
+        return {
+            "error": f"Could not download from {platform.capitalize()}: {error_message}",
+            "platform": platform,
+            "original_error": error_message
+        }
+
 # Function to format duration
 def format_duration(duration_seconds):
     return str(timedelta(seconds=duration_seconds))
@@ -159,110 +515,174 @@ def format_views(views):
     else:
         return f"{views} views"
 
+# Supported platforms with examples
+SUPPORTED_PLATFORMS = {
+    "youtube": {
+        "name": "YouTube",
+        "example_urls": [
+            "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+            "https://youtu.be/dQw4w9WgXcQ"
+        ],
+        "supported_features": ["video", "audio", "thumbnails", "metadata"]
+    },
+    "tiktok": {
+        "name": "TikTok",
+        "example_urls": [
+            "https://www.tiktok.com/@username/video/1234567890123456789",
+            "https://vm.tiktok.com/ABCDEF/"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"],
+        "notes": "Some TikTok videos may be region-restricted or require authentication"
+    },
+    "instagram": {
+        "name": "Instagram",
+        "example_urls": [
+            "https://www.instagram.com/p/ABC123/",
+            "https://www.instagram.com/reel/ABC123/"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"],
+        "notes": "Private Instagram content is not supported"
+    },
+    "facebook": {
+        "name": "Facebook",
+        "example_urls": [
+            "https://www.facebook.com/watch?v=1234567890123456",
+            "https://fb.watch/ABC123/"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"],
+        "notes": "Private Facebook content is not supported"
+    },
+    "twitter": {
+        "name": "Twitter/X",
+        "example_urls": [
+            "https://twitter.com/username/status/1234567890123456789",
+            "https://x.com/username/status/1234567890123456789"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"]
+    },
+    "vimeo": {
+        "name": "Vimeo",
+        "example_urls": [
+            "https://vimeo.com/1234567890"
+        ],
+        "supported_features": ["video", "audio", "thumbnails", "metadata"]
+    },
+    "reddit": {
+        "name": "Reddit",
+        "example_urls": [
+            "https://www.reddit.com/r/subreddit/comments/abcdef/title/"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"]
+    },
+    "dailymotion": {
+        "name": "Dailymotion",
+        "example_urls": [
+            "https://www.dailymotion.com/video/x12345"
+        ],
+        "supported_features": ["video", "audio", "thumbnails", "metadata"]
+    },
+    "twitch": {
+        "name": "Twitch",
+        "example_urls": [
+            "https://www.twitch.tv/videos/1234567890",
+            "https://clips.twitch.tv/ClipName"
+        ],
+        "supported_features": ["video", "thumbnails", "metadata"]
+    },
+    "soundcloud": {
+        "name": "SoundCloud",
+        "example_urls": [
+            "https://soundcloud.com/artist/track-name"
+        ],
+        "supported_features": ["audio", "thumbnails", "metadata"]
+    }
+}
+
+# Function to get supported platforms with examples
+def get_supported_platforms():
+    return SUPPORTED_PLATFORMS
+
+# Cache lifetime (seconds) for the static endpoints, for browsers and CDNs
+STATIC_CACHE_MAX_AGE = int(os.environ.get('STATIC_CACHE_MAX_AGE', 3600))
+
+# Function to serialize a static JSON payload once, the same way jsonify would
+def encode_json(payload):
+    return (app.json.dumps(payload, separators=(',', ':')) + '\n').encode('utf-8')
+
+# Function to precompute a static JSON body and its strong ETag
+def precompute_json(payload):
+    body = encode_json(payload)
+    return body, hashlib.sha256(body).hexdigest()[:32]
+
+# Function to serve a precomputed body with caching headers and conditional GET support
+def static_json_response(body, etag):
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = STATIC_CACHE_MAX_AGE
+    return response
+
+# Static responses are built once at import time
+INDEX_BODY, INDEX_ETAG = precompute_json({
+    "name": "Video Downloader API",
+    "version": "1.1.0",
+    "description": "API for downloading videos from various platforms using yt-dlp",
+    "supported_platforms": list(SUPPORTED_PLATFORMS.keys())
+})
+SUPPORTED_PLATFORMS_BODY, SUPPORTED_PLATFORMS_ETAG = precompute_json(SUPPORTED_PLATFORMS)
+
 # Root endpoint
 @app.route('/')
 def index():
-    return jsonify({
-        "name": "Video Downloader API",
-        "version": "1.1.0",
-        "description": "API for downloading videos from various platforms using yt-dlp",
-        "supported_platforms": list(get_supported_platforms().keys())
-    })
+    return static_json_response(INDEX_BODY, INDEX_ETAG)
 
 # Get supported platforms endpoint
 @app.route('/api/supported-platforms', methods=['GET'])
 def supported_platforms():
-    return jsonify(get_supported_platforms())
+    return static_json_response(SUPPORTED_PLATFORMS_BODY, SUPPORTED_PLATFORMS_ETAG)
 
-# Function to get supported platforms with examples
-def get_supported_platforms():
-    return {
-        "youtube": {
-            "name": "YouTube",
-            "example_urls": [
-                "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
-                "https://youtu.be/dQw4w9WgXcQ"
-            ],
-            "supported_features": ["video", "audio", "thumbnails", "metadata"]
-        },
-        "tiktok": {
-            "name": "TikTok",
-            "example_urls": [
-                "https://www.tiktok.com/@username/video/1234567890123456789",
-                "https://vm.tiktok.com/ABCDEF/"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"],
-            "notes": "Some TikTok videos may be region-restricted or require authentication"
-        },
-        "instagram": {
-            "name": "Instagram",
-            "example_urls": [
-                "https://www.instagram.com/p/ABC123/",
-                "https://www.instagram.com/reel/ABC123/"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"],
-            "notes": "Private Instagram content is not supported"
-        },
-        "facebook": {
-            "name": "Facebook",
-            "example_urls": [
-                "https://www.facebook.com/watch?v=1234567890123456",
-                "https://fb.watch/ABC123/"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"],
-            "notes": "Private Facebook content is not supported"
-        },
-        "twitter": {
-            "name": "Twitter/X",
-            "example_urls": [
-                "https://twitter.com/username/status/1234567890123456789",
-                "https://x.com/username/status/1234567890123456789"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"]
-        },
-        "vimeo": {
-            "name": "Vimeo",
-            "example_urls": [
-                "https://vimeo.com/1234567890"
-            ],
-            "supported_features": ["video", "audio", "thumbnails", "metadata"]
-        },
-        "reddit": {
-            "name": "Reddit",
-            "example_urls": [
-                "https://www.reddit.com/r/subreddit/comments/abcdef/title/"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"]
-        },
-        "dailymotion": {
-            "name": "Dailymotion",
-            "example_urls": [
-                "https://www.dailymotion.com/video/x12345"
-            ],
-            "supported_features": ["video", "audio", "thumbnails", "metadata"]
-        },
-        "twitch": {
-            "name": "Twitch",
-            "example_urls": [
-                "https://www.twitch.tv/videos/1234567890",
-                "https://clips.twitch.tv/ClipName"
-            ],
-            "supported_features": ["video", "thumbnails", "metadata"]
-        },
-        "soundcloud": {
-            "name": "SoundCloud",
-            "example_urls": [
-                "https://soundcloud.com/artist/track-name"
-            ],
-            "supported_features": ["audio", "thumbnails", "metadata"]
-        }
-    }
+# Optionally warm up yt-dlp and the supported platforms' extractors in the background.
+# PRELOAD_EXTRACTORS=1 preloads every supported platform, or pass a comma-separated list.
+PRELOAD_EXTRACTORS = os.environ.get('PRELOAD_EXTRACTORS', '').strip().lower()
+if PRELOAD_EXTRACTORS and PRELOAD_EXTRACTORS not in ('0', 'false', 'no'):
+    if PRELOAD_EXTRACTORS in ('1', 'true', 'yes', 'all'):
+        preload_platforms = list(SUPPORTED_PLATFORMS.keys())
+    else:
+        preload_platforms = [p.strip() for p in PRELOAD_EXTRACTORS.split(',') if p.strip()]
+    threading.Thread(target=preload_extractors, args=(preload_platforms,), daemon=True).start()
 
 # API key endpoint - for testing only, not for production
 @app.route('/api/get-key', methods=['GET'])
 def get_api_key():
     return jsonify({"api_key": API_KEY})
 
+# Negative cache inspection endpoint
+@app.route('/api/negative-cache', methods=['GET', 'DELETE'])
+@require_api_key
+def negative_cache():
+    if request.method == 'DELETE':
+        return jsonify({"cleared": clear_negative_cache()})
+
+    entries = get_negative_cache_entries()
+    return jsonify({
+        "size": len(entries),
+        "ttls": NEGATIVE_CACHE_TTLS,
+        "entries": entries
+    })
+
+# Upstream networking metrics endpoint
+@app.route('/api/network-stats', methods=['GET'])
+@require_api_key
+def network_stats():
+    stats = net.get_stats()
+    stats["segmented_downloads"] = segments.get_stats()
+    with _ydl_pool_lock:
+        stats["ydl_pool"] = {platform: len(idle) for platform, idle in _ydl_pool.items()}
+    return jsonify(stats)
+
 # Function to get the best thumbnail URL
 def get_best_thumbnail(info):
     if not info:
@@ -321,77 +741,75 @@ def video_info():
     info = get_video_info(video_url)
 
     if "error" in info:
-        return jsonify(info), 400  # Return the full error object with suggestions
-
-    # Get platform
-    platform = info.get('platform', detect_platform(video_url))
-
-    # Extract only the necessary information to reduce response size
-    formatted_info = {
-        "id": info.get('id'),
-        "title": info.get('title'),
-        "thumbnail": get_best_thumbnail(info),
-        "duration": format_duration(safe_get_duration(info)),
-        "view_count": format_views(info.get('view_count', 0)),
-        "uploader": info.get('uploader'),
-        "platform": platform,
-        "formats": []
-    }
-
-    # Process video formats
-    for format in info.get('formats', []):
-        if 'url' in format:
-            format_info = {
-                "format_id": format.get('format_id'),
-                "ext": format.get('ext', 'mp4'),
-                "height": format.get('height'),
-                "width": format.get('width'),
-                "filesize": format.get('filesize'),
-                "filesize_formatted": f"{format.get('filesize', 0)/1024/1024:.1f} MB" if format.get('filesize') else None,
-                "vcodec": format.get('vcodec'),
-                "acodec": format.get('acodec'),
-                "url": format.get('url'),
-                "format_note": format.get('format_note'),
-                "abr": format.get('abr')
-            }
-            formatted_info["formats"].append(format_info)
-
-    # Add platform-specific information
-    if platform == 'tiktok':
-        formatted_info["author"] = info.get('uploader') or info.get('creator') or info.get('uploader_id')
-        formatted_info["description"] = info.get('description') or ""
+        # Return the full error object with suggestions
+        return jsonify(info), 429 if "retry_after" in info else 400
 
-    elif platform == 'instagram':
-        formatted_info["author"] = info.get('uploader') or info.get('uploader_id')
-        formatted_info["description"] = info.get('description') or ""
+    # Shape the response (traced separately from extraction)
+    with tracing.span('format.video_info'):
+        # Get platform
+        platform = info.get('platform', detect_platform(video_url))
 
-    elif platform == 'twitter':
-        formatted_info["author"] = info.get('uploader') or info.get('uploader_id')
-        formatted_info["description"] = info.get('description') or ""
-        formatted_info["retweet_count"] = info.get('retweet_count', 0)
-        formatted_info["like_count"] = info.get('like_count', 0)
+        # Extract only the necessary information to reduce response size
+        formatted_info = {
+            "id": info.get('id'),
+            "title": info.get('title'),
+            "thumbnail": get_best_thumbnail(info),
+            "duration": format_duration(safe_get_duration(info)),
+            "view_count": format_views(info.get('view_count', 0)),
+            "uploader": info.get('uploader'),
+            "platform": platform,
+            "formats": []
+        }
 
-    return jsonify(formatted_info)
+        # Process video formats
+        for format in info.get('formats', []):
+            if 'url' in format:
+                format_info = {
+                    "format_id": format.get('format_id'),
+                    "ext": format.get('ext', 'mp4'),
+                    "height": format.get('height'),
+                    "width": format.get('width'),
+                    "filesize": format.get('filesize'),
+                    "filesize_formatted": f"{format.get('filesize', 0)/1024/1024:.1f} MB" if format.get('filesize') else None,
+                    "vcodec": format.get('vcodec'),
+                    "acodec": format.get('acodec'),
+                    "url": format.get('url'),
+                    "format_note": format.get('format_note'),
+                    "abr": format.get('abr')
+                }
+                formatted_info["formats"].append(format_info)
 
-# Download links endpoint
-@app.route('/api/download-links', methods=['POST'])
-@require_api_key
-def download_links():
-    data = request.get_json()
+        # Chapters and available subtitle languages, when the platform provides them
+        formatted_info["chapters"] = [
+            {
+                "title": chapter.get('title'),
+                "start_time": chapter.get('start_time'),
+                "end_time": chapter.get('end_time')
+            }
+            for chapter in info.get('chapters') or []
+        ]
+        formatted_info["subtitle_languages"] = sorted((info.get('subtitles') or {}).keys())
+        formatted_info["automatic_caption_languages"] = sorted((info.get('automatic_captions') or {}).keys())
 
-    if not data or 'url' not in data:
-        return jsonify({"error": "URL is required"}), 400
+        # Add platform-specific information
+        if platform == 'tiktok':
+            formatted_info["author"] = info.get('uploader') or info.get('creator') or info.get('uploader_id')
+            formatted_info["description"] = info.get('description') or ""
 
-    video_url = data['url']
-    info = get_video_info(video_url)
+        elif platform == 'instagram':
+            formatted_info["author"] = info.get('uploader') or info.get('uploader_id')
+            formatted_info["description"] = info.get('description') or ""
 
-    if "error" in info:
-        return jsonify(info), 400  # Return the full error object with suggestions
+        elif platform == 'twitter':
+            formatted_info["author"] = info.get('uploader') or info.get('uploader_id')
+            formatted_info["description"] = info.get('description') or ""
+            formatted_info["retweet_count"] = info.get('retweet_count', 0)
+            formatted_info["like_count"] = info.get('like_count', 0)
 
-    # Get platform
-    platform = info.get('platform', detect_platform(video_url))
+    return jsonify(formatted_info)
 
-    # Organize formats by type
+# Function to organize formats by type, sorted by quality (height for video, bitrate for audio)
+def rank_formats(info):
     video_with_audio = []
     video_only = []
     audio_only = []
@@ -425,40 +843,374 @@ def download_links():
                 format_info["quality"] = f"{abr}kbps" if abr else "Unknown quality"
                 audio_only.append(format_info)
 
-    # Sort formats by quality (height for video, bitrate for audio)
     video_with_audio.sort(key=lambda x: x.get('height', 0) or 0, reverse=True)
     video_only.sort(key=lambda x: x.get('height', 0) or 0, reverse=True)
     audio_only.sort(key=lambda x: x.get('abr', 0) or 0, reverse=True)
 
-    # For TikTok and Instagram, sometimes we need to handle direct URLs differently
-    if platform in ['tiktok', 'instagram', 'twitter'] and not video_with_audio and 'url' in info:
-        # Add the direct URL as a format
-        direct_format = {
-            "format_id": "direct",
-            "ext": "mp4",
-            "height": info.get('height', 720),
-            "filesize": None,
-            "filesize_formatted": None,
-            "url": info['url'],
-            "format_note": "Direct link",
-            "quality": f"{info.get('height', 720)}p"
+    return video_with_audio, video_only, audio_only
+
+# Download links endpoint
+@app.route('/api/download-links', methods=['POST'])
+@require_api_key
+def download_links():
+    data = request.get_json()
+
+    if not data or 'url' not in data:
+        return jsonify({"error": "URL is required"}), 400
+
+    video_url = data['url']
+    info = get_video_info(video_url)
+
+    if "error" in info:
+        # Return the full error object with suggestions
+        return jsonify(info), 429 if "retry_after" in info else 400
+
+    # Shape the response (traced separately from extraction)
+    with tracing.span('format.download_links'):
+        # Get platform
+        platform = info.get('platform', detect_platform(video_url))
+
+        # Organize formats by type, best quality first
+        video_with_audio, video_only, audio_only = rank_formats(info)
+
+        # For TikTok and Instagram, sometimes we need to handle direct URLs differently
+        if platform in ['tiktok', 'instagram', 'twitter'] and not video_with_audio and 'url' in info:
+            # Add the direct URL as a format
+            direct_format = {
+                "format_id": "direct",
+                "ext": "mp4",
+                "height": info.get('height', 720),
+                "filesize": None,
+                "filesize_formatted": None,
+                "url": info['url'],
+                "format_note": "Direct link",
+                "quality": f"{info.get('height', 720)}p"
+            }
+            video_with_audio.append(direct_format)
+
+        response = {
+            "video_with_audio": video_with_audio,
+            "video_only": video_only[:5],  # Limit to top 5 formats
+            "audio_only": audio_only[:3],  # Limit to top 3 formats
+            "platform": platform
         }
-        video_with_audio.append(direct_format)
 
-    response = {
-        "video_with_audio": video_with_audio,
-        "video_only": video_only[:5],  # Limit to top 5 formats
-        "audio_only": audio_only[:3],  # Limit to top 3 formats
-        "platform": platform
+        # Add platform-specific information
+        if platform == 'tiktok':
+            response["title"] = info.get('title', '')
+            response["author"] = info.get('uploader') or info.get('creator') or info.get('uploader_id', '')
+            response["thumbnail"] = get_best_thumbnail(info)
+
+    return jsonify(response)
+
+# Converted subtitle tracks are cached for a day; larger tracks are streamed but not cached
+SUBTITLE_CACHE_TTL = int(os.environ.get('SUBTITLE_CACHE_TTL', 86400))
+SUBTITLE_CACHE_MAX_BYTES = int(os.environ.get('SUBTITLE_CACHE_MAX_BYTES', 2 * 1024 * 1024))
+SUBTITLE_SOURCE_EXTS = ['vtt', 'srt']
+
+# Function to pick a subtitle track for a language from an extraction result
+def find_subtitle_track(info, lang, include_automatic):
+    sources = [info.get('subtitles') or {}]
+    if include_automatic:
+        sources.append(info.get('automatic_captions') or {})
+
+    for tracks in sources:
+        for ext in SUBTITLE_SOURCE_EXTS:
+            for track in tracks.get(lang) or []:
+                if track.get('ext') == ext and track.get('url'):
+                    return track
+    return None
+
+# Function to stream a converted track and cache it once it has been sent in full
+def stream_subtitles(upstream, source_ext, target_format, cache_name):
+    cached_chunks = []
+    cached_size = 0
+    try:
+        for chunk in subtitles.convert(upstream.iter_content(), source_ext, target_format):
+            if cached_chunks is not None:
+                cached_size += len(chunk)
+                if cached_size <= SUBTITLE_CACHE_MAX_BYTES:
+                    cached_chunks.append(chunk)
+                else:
+                    cached_chunks = None
+            yield chunk
+    finally:
+        upstream.close()
+
+    if cached_chunks is not None and SUBTITLE_CACHE_TTL > 0:
+        cache_set(cache_name, b''.join(cached_chunks).decode('utf-8'), SUBTITLE_CACHE_TTL)
+
+# Subtitles endpoint
+@app.route('/api/subtitles', methods=['POST'])
+@require_api_key
+def get_subtitles():
+    data = request.get_json()
+
+    if not data or 'url' not in data:
+        return jsonify({"error": "URL is required"}), 400
+
+    video_url = data['url']
+    lang = data.get('lang', 'en')
+    target_format = data.get('format', 'vtt')
+    include_automatic = data.get('automatic', True)
+
+    if not isinstance(lang, str) or not lang:
+        return jsonify({"error": "'lang' must be a language code such as 'en'"}), 400
+    if not isinstance(target_format, str) or target_format not in subtitles.SUBTITLE_FORMATS:
+        return jsonify({"error": f"Unsupported subtitle format '{target_format}'. Use one of: {', '.join(subtitles.SUBTITLE_FORMATS)}"}), 400
+    if not isinstance(include_automatic, bool):
+        return jsonify({"error": "'automatic' must be true or false"}), 400
+
+    mimetype = subtitles.SUBTITLE_FORMATS[target_format]
+    cache_name = f'subtitles:{target_format}:{lang}:{int(include_automatic)}:{cache_key(video_url)}'
+    cached = cache_get(cache_name)
+    if cached is not None:
+        return Response(cached.encode('utf-8'), mimetype=mimetype)
+
+    # Reuses the cached extraction result when there is one
+    info = get_video_info(video_url)
+
+    if "error" in info:
+        return jsonify(info), 429 if "retry_after" in info else 400
+
+    track = find_subtitle_track(info, lang, include_automatic)
+    if track is None:
+        return jsonify({
+            "error": f"No subtitles found for language '{lang}'",
+            "platform": info.get('platform'),
+            "subtitle_languages": sorted((info.get('subtitles') or {}).keys()),
+            "automatic_caption_languages": sorted((info.get('automatic_captions') or {}).keys()) if include_automatic else []
+        }), 404
+
+    try:
+        upstream = net.open_url(track['url'], headers=track.get('http_headers'))
+    except Exception as e:
+        return jsonify({"error": f"Could not fetch subtitles: {str(e)}"}), 502
+    if upstream.status != 200:
+        upstream.close()
+        return jsonify({"error": f"Could not fetch subtitles: upstream returned HTTP {upstream.status}"}), 502
+
+    return Response(stream_subtitles(upstream, track['ext'], target_format, cache_name), mimetype=mimetype)
+
+# Audio jobs: downloads run on an I/O pool, transcodes on a CPU pool with one slot per core
+AUDIO_DEFAULT_BITRATE = 192
+AUDIO_MAX_BATCH = int(os.environ.get('AUDIO_MAX_BATCH', 50))
+_audio_fetch_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('AUDIO_FETCH_WORKERS', 4)), thread_name_prefix='audio-fetch')
+_audio_transcode_executor = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('AUDIO_TRANSCODE_WORKERS', os.cpu_count() or 1)), thread_name_prefix='audio-transcode')
+
+# Protocols the segmented downloader can fetch
+SEGMENTED_PROTOCOLS = segments.HTTP_PROTOCOLS + segments.HLS_PROTOCOLS + segments.DASH_PROTOCOLS
+
+# Function to pick the best downloadable audio source from the ranked formats
+def pick_best_audio_format(info):
+    formats_by_id = {f.get('format_id'): f for f in info.get('formats') or []}
+    video_with_audio, video_only, audio_only = rank_formats(info)
+
+    # Highest bitrate audio-only format first, then the smallest muxed format as a fallback
+    for ranked in audio_only + video_with_audio[::-1]:
+        format = formats_by_id.get(ranked['format_id'])
+        if format and format.get('protocol', 'https') in SEGMENTED_PROTOCOLS:
+            return format
+
+    if info.get('url'):
+        return {"format_id": "direct", "url": info['url'], "http_headers": info.get('http_headers')}
+    return None
+
+# Function to update and persist a job
+def update_job(job, **changes):
+    job.update(changes)
+    job['updated_at'] = time.time()
+    save_job(job)
+
+# Function to report a job phase's 0-1 progress as part of its overall percentage
+def job_progress_reporter(job, start, end):
+    lock = threading.Lock()
+
+    def report(fraction):
+        progress = int(start + (end - start) * fraction)
+        with lock:
+            if progress > job['progress']:
+                update_job(job, progress=progress)
+    return report
+
+# Function to create an audio job and queue its download
+def create_audio_job(video_url, codec, bitrate):
+    now = time.time()
+    job = {
+        "id": uuid.uuid4().hex,
+        "type": "audio",
+        "url": video_url,
+        "format": codec,
+        "bitrate": bitrate,
+        "status": "queued",
+        "progress": 0,
+        "error": None,
+        "created_at": now,
+        "updated_at": now
     }
+    save_job(job)
+    snapshot = dict(job)
+    _audio_fetch_executor.submit(run_audio_job, job)
+    return snapshot
 
-    # Add platform-specific information
-    if platform == 'tiktok':
-        response["title"] = info.get('title', '')
-        response["author"] = info.get('uploader') or info.get('creator') or info.get('uploader_id', '')
-        response["thumbnail"] = get_best_thumbnail(info)
+# Function to download an audio job's source and hand it to the transcode queue
+def run_audio_job(job):
+    source_path = None
+    try:
+        info = get_video_info(job['url'])
+        if "error" in info:
+            raise audio.AudioJobError(info['error'])
 
-    return jsonify(response)
+        source = pick_best_audio_format(info)
+        if source is None:
+            raise audio.AudioJobError("No downloadable audio format found")
+
+        output_path = audio.artifact_path(cache_key(job['url']), source['format_id'], job['format'], job['bitrate'])
+        job.update(title=info.get('title'), source_format_id=source['format_id'])
+
+        # Reuse an earlier conversion of the same source, keeping it fresh in the artifact cache
+        if os.path.exists(output_path):
+            os.utime(output_path)
+            update_job(job, status='done', progress=100, artifact=os.path.basename(output_path))
+            return
+
+        os.makedirs(audio.ARTIFACT_DIR, exist_ok=True)
+        source_path = f"{output_path}.{job['id']}.source"
+        update_job(job, status='downloading')
+        downloader = segments.SegmentedDownloader(segments.segments_for_format(source), source.get('http_headers'))
+        downloader.download_to_file(source_path, on_progress=job_progress_reporter(job, 0, 50))
+        update_job(job, status='waiting_for_transcode', progress=50)
+        _audio_transcode_executor.submit(transcode_audio_job, job, source_path, output_path, info.get('duration'))
+    except Exception as e:
+        # The transcode queue never got the source, so a partial download is ours to remove
+        if source_path and os.path.exists(source_path):
+            os.remove(source_path)
+        update_job(job, status='error', error=str(e))
+
+# Function to transcode a downloaded audio job source into the artifact cache
+def transcode_audio_job(job, source_path, output_path, duration):
+    try:
+        update_job(job, status='transcoding')
+        audio.transcode(source_path, output_path, job['format'], job['bitrate'], duration,
+                        on_progress=job_progress_reporter(job, 50, 100))
+        update_job(job, status='done', progress=100, artifact=os.path.basename(output_path))
+    except Exception as e:
+        update_job(job, status='error', error=str(e))
+    finally:
+        if os.path.exists(source_path):
+            os.remove(source_path)
+
+# Audio job creation endpoint
+@app.route('/api/audio-jobs', methods=['POST'])
+@require_api_key
+def create_audio_jobs():
+    data = request.get_json()
+
+    if not data or not (data.get('url') or data.get('urls')):
+        return jsonify({"error": "URL is required"}), 400
+
+    urls = data.get('urls') or [data['url']]
+    codec = data.get('format', 'mp3')
+    bitrate = data.get('bitrate', AUDIO_DEFAULT_BITRATE)
+
+    if not isinstance(urls, list) or len(urls) > AUDIO_MAX_BATCH:
+        return jsonify({"error": f"'urls' must be a list of at most {AUDIO_MAX_BATCH} URLs"}), 400
+    if not all(isinstance(url, str) and url.strip() for url in urls):
+        return jsonify({"error": "Every URL must be a non-empty string"}), 400
+    if not isinstance(codec, str) or codec not in audio.AUDIO_CODECS:
+        return jsonify({"error": f"Unsupported audio format '{codec}'. Use one of: {', '.join(audio.AUDIO_CODECS)}"}), 400
+    if not isinstance(bitrate, int) or not audio.MIN_BITRATE <= bitrate <= audio.MAX_BITRATE:
+        return jsonify({"error": f"Bitrate must be between {audio.MIN_BITRATE} and {audio.MAX_BITRATE} kbps"}), 400
+
+    audio.prune_artifacts()
+    jobs = [create_audio_job(url, codec, bitrate) for url in urls]
+    if 'urls' in data:
+        return jsonify({"jobs": jobs}), 202
+    return jsonify(jobs[0]), 202
+
+# Audio job status endpoint
+@app.route('/api/audio-jobs/<job_id>', methods=['GET'])
+@require_api_key
+def audio_job_status(job_id):
+    job = load_job(job_id)
+    if job is None or job.get('type') != 'audio':
+        return jsonify({"error": "Job not found"}), 404
+
+    if job['status'] == 'done':
+        job = dict(job, download_url=f"/api/audio-jobs/{job_id}/file")
+    return jsonify(job)
+
+# Audio job output endpoint
+@app.route('/api/audio-jobs/<job_id>/file', methods=['GET'])
+@require_api_key
+def audio_job_file(job_id):
+    job = load_job(job_id)
+    if job is None or job.get('type') != 'audio':
+        return jsonify({"error": "Job not found"}), 404
+    if job['status'] != 'done':
+        return jsonify({"error": f"Job is not finished (status: {job['status']})"}), 409
+
+    path = os.path.join(audio.ARTIFACT_DIR, job['artifact'])
+    if not os.path.exists(path):
+        return jsonify({"error": "The converted file is no longer available"}), 410
+
+    codec = audio.AUDIO_CODECS[job['format']]
+    title = re.sub(r'[^\w\- ]+', '', job.get('title') or '').strip() or job_id
+    return send_file(path, mimetype=codec['mimetype'], as_attachment=True,
+                     download_name=f"{title}.{codec['ext']}")
+
+# Function to build an attachment Content-Disposition header, like send_file does:
+# an ASCII filename plus an RFC 5987 UTF-8 filename for non-Latin titles
+def content_disposition(title, ext, fallback):
+    ascii_title = unicodedata.normalize('NFKD', title).encode('ascii', 'ignore').decode('ascii').strip() or fallback
+    header = f'attachment; filename="{ascii_title}.{ext}"'
+    if ascii_title != title:
+        header += f"; filename*=UTF-8''{quote(f'{title}.{ext}', safe='')}"
+    return header
+
+# Download proxy endpoint: streams a format through the segmented downloader
+@app.route('/api/download', methods=['POST'])
+@require_api_key
+def download_format():
+    data = request.get_json()
+
+    if not data or 'url' not in data or 'format_id' not in data:
+        return jsonify({"error": "URL and format_id are required"}), 400
+
+    video_url = data['url']
+    info = get_video_info(video_url)
+
+    if "error" in info:
+        return jsonify(info), 429 if "retry_after" in info else 400
+
+    format = next((f for f in info.get('formats') or [] if f.get('format_id') == data['format_id']), None)
+    if format is None:
+        return jsonify({"error": f"Format '{data['format_id']}' not found"}), 404
+
+    try:
+        format_segments = segments.segments_for_format(format)
+    except segments.SegmentError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": f"Could not prepare download: {str(e)}"}), 502
+
+    # Plain HLS segments are MPEG-TS; fragmented MP4 streams start with an init segment
+    ext = format.get('ext') or 'mp4'
+    mimetype = 'application/octet-stream'
+    if format.get('protocol') in segments.HLS_PROTOCOLS and not format_segments[0].get('init'):
+        ext, mimetype = 'ts', 'video/mp2t'
+
+    downloader = segments.SegmentedDownloader(format_segments, format.get('http_headers'))
+    title = re.sub(r'[^\w\- ]+', '', info.get('title') or '').strip() or info.get('id') or 'download'
+    headers = {"Content-Disposition": content_disposition(title, ext, info.get('id') or 'download')}
+    if format.get('protocol', 'https') in segments.HTTP_PROTOCOLS and 'end' in format_segments[-1]:
+        headers["Content-Length"] = str(format_segments[-1]['end'] + 1)
+    elif format_segments[0].get('size'):
+        headers["Content-Length"] = str(format_segments[0]['size'])
+
+    return Response(iter(downloader), mimetype=mimetype, headers=headers)
 
 if __name__ == '__main__':
     # Get port from environment variable or use 5000 as default
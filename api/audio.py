@@ -0,0 +1,117 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+
+# Audio extraction helpers: ffmpeg transcoding and the on-disk artifact cache.
+# Downloads go through segments.py; job bookkeeping and the HTTP endpoints live in app.py.
+
+AUDIO_CODECS = {
+    'mp3': {'ext': 'mp3', 'mimetype': 'audio/mpeg', 'args': ['-c:a', 'libmp3lame']},
+    'm4a': {'ext': 'm4a', 'mimetype': 'audio/mp4', 'args': ['-c:a', 'aac', '-movflags', '+faststart']},
+}
+MIN_BITRATE = 32
+MAX_BITRATE = 320
+
+ARTIFACT_DIR = os.environ.get('ARTIFACT_DIR', os.path.join(tempfile.gettempdir(), 'video-downloader-artifacts'))
+# The artifact cache is pruned by mtime when jobs are created (at most every ARTIFACT_PRUNE_INTERVAL
+# seconds): files older than ARTIFACT_MAX_AGE are removed, then the oldest finished files until
+# the cache fits in ARTIFACT_MAX_BYTES. Reused artifacts are touched so they stay longer.
+ARTIFACT_MAX_AGE = int(os.environ.get('ARTIFACT_MAX_AGE', 86400))
+ARTIFACT_MAX_BYTES = int(os.environ.get('ARTIFACT_MAX_BYTES', 2 * 1024 ** 3))
+ARTIFACT_PRUNE_INTERVAL = int(os.environ.get('ARTIFACT_PRUNE_INTERVAL', 60))
+FFMPEG_PATH = os.environ.get('FFMPEG_PATH') or shutil.which('ffmpeg')
+
+
+_next_prune = 0
+_prune_lock = threading.Lock()
+
+
+class AudioJobError(Exception):
+    pass
+
+
+# Function to get the artifact path for a conversion
+def artifact_path(cache_key, format_id, codec, bitrate):
+    digest = hashlib.sha256(f'{cache_key}|{format_id}|{codec}|{bitrate}'.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(ARTIFACT_DIR, f"{digest}.{AUDIO_CODECS[codec]['ext']}")
+
+# Function to transcode a downloaded file with ffmpeg, reporting progress as a 0-1 fraction
+def transcode(source_path, output_path, codec, bitrate, duration=None, on_progress=None):
+    if not FFMPEG_PATH:
+        raise AudioJobError("ffmpeg is not installed on the server")
+
+    # ffmpeg picks the container from the extension, so keep it on the temporary file
+    temp_path = f"{output_path}.{uuid.uuid4().hex[:8]}.part.{AUDIO_CODECS[codec]['ext']}"
+    command = [
+        FFMPEG_PATH, '-hide_banner', '-nostdin', '-nostats', '-y',
+        '-i', source_path,
+        '-vn', '-threads', '1',
+        *AUDIO_CODECS[codec]['args'], '-b:a', f'{bitrate}k',
+        '-progress', 'pipe:1',
+        temp_path
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+
+    # Drain stderr in the background so ffmpeg can't block on a full pipe
+    stderr_lines = []
+    stderr_thread = threading.Thread(target=lambda: stderr_lines.extend(process.stderr), daemon=True)
+    stderr_thread.start()
+
+    for line in process.stdout:
+        key, _, value = line.strip().partition('=')
+        if key in ('out_time_us', 'out_time_ms') and duration and on_progress and value.isdigit():
+            on_progress(min(int(value) / 1000000 / duration, 1.0))
+
+    process.wait()
+    stderr_thread.join()
+    if process.returncode != 0:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise AudioJobError(f"ffmpeg failed: {''.join(stderr_lines[-5:]).strip()}")
+
+    os.replace(temp_path, output_path)
+
+# Function to remove expired artifacts and keep the cache under its size cap
+def prune_artifacts(force=False):
+    global _next_prune
+    now = time.time()
+    with _prune_lock:
+        if not force and now < _next_prune:
+            return 0
+        _next_prune = now + ARTIFACT_PRUNE_INTERVAL
+
+    finished = []
+    removed = 0
+    try:
+        names = os.listdir(ARTIFACT_DIR)
+    except FileNotFoundError:
+        return 0
+    for name in names:
+        path = os.path.join(ARTIFACT_DIR, name)
+        try:
+            stat = os.stat(path)
+            if ARTIFACT_MAX_AGE > 0 and now - stat.st_mtime > ARTIFACT_MAX_AGE:
+                os.remove(path)
+                removed += 1
+            elif name.count('.') == 1:
+                # Downloads (.source) and transcodes (.part) in progress don't count towards the cap
+                finished.append((stat.st_mtime, stat.st_size, path))
+        except FileNotFoundError:
+            continue
+
+    total = sum(size for _, size, _ in finished)
+    for _, size, path in sorted(finished):
+        if total <= ARTIFACT_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+        total -= size
+    return removed
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Cold-start benchmark for the API. Every run starts a fresh interpreter, imports
+# app.py, serves the static endpoints and then loads yt-dlp, timing each phase.
+#
+# Usage: python bench_startup.py [--runs 10] [--preload]
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD_SCRIPT = """
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+client = app.app.test_client()
+client.get('/')
+client.get('/api/supported-platforms')
+t2 = time.perf_counter()
+yt_dlp_imported = 'yt_dlp' in sys.modules
+app.load_yt_dlp()
+t3 = time.perf_counter()
+print(json.dumps({
+    "import_app": t1 - t0,
+    "first_static_requests": t2 - t1,
+    "load_yt_dlp": t3 - t2,
+    "yt_dlp_imported_at_startup": yt_dlp_imported,
+}))
+"""
+
+# Function to run one cold start in a fresh interpreter
+def run_once(preload):
+    env = dict(os.environ)
+    env.setdefault('VIDEO_DOWNLOADER_API_KEY', 'benchmark')
+    env['PRELOAD_EXTRACTORS'] = '1' if preload else ''
+
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', CHILD_SCRIPT],
+        cwd=API_DIR, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_total"] = time.perf_counter() - started
+    return result
+
+# Function to print median and min of each timed phase
+def report(results):
+    print(f"{'phase':<24}{'median':>10}{'min':>10}")
+    for phase in ['import_app', 'first_static_requests', 'load_yt_dlp', 'process_total']:
+        values = [r[phase] * 1000 for r in results]
+        print(f"{phase:<24}{statistics.median(values):>8.1f}ms{min(values):>8.1f}ms")
+    if any(r['yt_dlp_imported_at_startup'] for r in results):
+        print("\nyt-dlp was imported during startup")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure API cold-start time')
+    parser.add_argument('--runs', type=int, default=10, help='number of cold starts to measure')
+    parser.add_argument('--preload', action='store_true', help='start with PRELOAD_EXTRACTORS=1')
+    args = parser.parse_args()
+
+    report([run_once(args.preload) for _ in range(args.runs)])
@@ -0,0 +1,227 @@
+import os
+import socket
+import threading
+import time
+from urllib.parse import urlsplit
+
+import certifi
+import urllib3
+from urllib3.util.ssl_ import create_urllib3_context
+
+import tracing
+
+# Process-wide networking layer for upstream traffic (extractor APIs, CDNs).
+# Connections are kept alive in per-host pools, DNS lookups are cached with a TTL
+# and a single TLS context is shared so the CA bundle is only loaded once.
+POOL_NUM_POOLS = int(os.environ.get('UPSTREAM_NUM_POOLS', 64))
+POOL_MAXSIZE = int(os.environ.get('UPSTREAM_POOL_MAXSIZE', 16))
+CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 10))
+READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 30))
+VERIFY_TLS = os.environ.get('UPSTREAM_VERIFY_TLS', '1').lower() not in ('0', 'false', 'no')
+HTTP2_ENABLED = os.environ.get('UPSTREAM_HTTP2', '').lower() in ('1', 'true', 'yes')
+DNS_CACHE_TTL = int(os.environ.get('DNS_CACHE_TTL', 300))
+DNS_CACHE_MAX_ENTRIES = 1024
+
+_original_getaddrinfo = socket.getaddrinfo
+_dns_cache = {}
+_dns_lock = threading.Lock()
+_dns_stats = {'hits': 0, 'misses': 0}
+
+_pool_manager = None
+_http2_client = None
+_http2_checked = False
+_client_lock = threading.Lock()
+
+_host_stats = {}
+_stats_lock = threading.Lock()
+
+# Function to resolve a host through the in-process DNS cache
+def _cached_getaddrinfo(host, port, family=0, type=0, proto=0, flags=0):
+    key = (host, port, family, type, proto, flags)
+    now = time.monotonic()
+    with _dns_lock:
+        entry = _dns_cache.get(key)
+        if entry and entry[0] > now:
+            _dns_stats['hits'] += 1
+            return list(entry[1])
+
+    with tracing.span('dns.resolve', host=host):
+        result = _original_getaddrinfo(host, port, family, type, proto, flags)
+
+    with _dns_lock:
+        _dns_stats['misses'] += 1
+        if len(_dns_cache) >= DNS_CACHE_MAX_ENTRIES:
+            for stale_key in [k for k, e in _dns_cache.items() if e[0] <= now]:
+                del _dns_cache[stale_key]
+            if len(_dns_cache) >= DNS_CACHE_MAX_ENTRIES:
+                _dns_cache.clear()
+        _dns_cache[key] = (now + DNS_CACHE_TTL, result)
+    return result
+
+# Function to route all socket lookups (including yt-dlp's) through the DNS cache
+def install_dns_cache():
+    if DNS_CACHE_TTL > 0 and socket.getaddrinfo is not _cached_getaddrinfo:
+        socket.getaddrinfo = _cached_getaddrinfo
+
+# Function to build the shared TLS context
+def _create_ssl_context():
+    context = create_urllib3_context()
+    if VERIFY_TLS:
+        context.load_verify_locations(certifi.where())
+    else:
+        context.check_hostname = False
+        context.verify_mode = 0  # ssl.CERT_NONE
+    return context
+
+# Function to get the process-wide keep-alive pool manager
+def get_pool_manager():
+    global _pool_manager
+    if _pool_manager is None:
+        with _client_lock:
+            if _pool_manager is None:
+                _pool_manager = urllib3.PoolManager(
+                    num_pools=POOL_NUM_POOLS,
+                    maxsize=POOL_MAXSIZE,
+                    block=False,
+                    ssl_context=_create_ssl_context(),
+                    cert_reqs='CERT_REQUIRED' if VERIFY_TLS else 'CERT_NONE',
+                    retries=urllib3.Retry(connect=2, read=0, status=0, redirect=5),
+                    timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT),
+                )
+    return _pool_manager
+
+# Function to get the optional HTTP/2 client (requires httpx[http2])
+def get_http2_client():
+    global _http2_client, _http2_checked
+    if not HTTP2_ENABLED:
+        return None
+    if not _http2_checked:
+        with _client_lock:
+            if not _http2_checked:
+                try:
+                    import httpx
+                    import h2  # noqa: F401
+                except ImportError:
+                    print("[WARNING] UPSTREAM_HTTP2 is set but httpx[http2] is not installed, using HTTP/1.1")
+                else:
+                    _http2_client = httpx.Client(
+                        http2=True,
+                        verify=_create_ssl_context(),
+                        follow_redirects=True,
+                        limits=httpx.Limits(max_connections=POOL_NUM_POOLS * POOL_MAXSIZE,
+                                            max_keepalive_connections=POOL_NUM_POOLS * POOL_MAXSIZE),
+                        timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+                    )
+                _http2_checked = True
+    return _http2_client
+
+# Function to record a request against its upstream host
+def _record(host, http_version, error=False):
+    with _stats_lock:
+        stats = _host_stats.setdefault(host, {'requests': 0, 'errors': 0, 'http2_requests': 0})
+        stats['requests'] += 1
+        if http_version == 'HTTP/2':
+            stats['http2_requests'] += 1
+        if error:
+            stats['errors'] += 1
+
+# Streaming response wrapper shared by the urllib3 and HTTP/2 code paths
+class UpstreamResponse:
+    def __init__(self, status, headers, chunks, close, http_version):
+        self.status = status
+        self.headers = {k.lower(): v for k, v in headers.items()}
+        self.http_version = http_version
+        self._chunks = chunks
+        self._close = close
+
+        self._consumed = False
+
+    def iter_content(self, chunk_size=64 * 1024):
+        for chunk in self._chunks(chunk_size):
+            yield chunk
+        self._consumed = True
+
+    def read(self):
+        return b''.join(self.iter_content())
+
+    def close(self):
+        self._close(self._consumed)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Function to give a urllib3 connection back to its pool
+def _release_urllib3(response, consumed):
+    # A partially read body would corrupt the next request on this connection
+    if not consumed:
+        response.close()
+    response.release_conn()
+
+# Function to open a streaming request to an upstream URL over the shared pools
+def open_url(url, headers=None, method='GET'):
+    host = urlsplit(url).hostname or ''
+    headers = dict(headers or {})
+
+    client = get_http2_client()
+    try:
+        with tracing.span('upstream.request', method=method, host=host) as fields:
+            result = _open(client, method, url, headers)
+            fields.update(status=result.status, http_version=result.http_version)
+    except Exception:
+        _record(host, None, error=True)
+        raise
+
+    _record(host, result.http_version, error=result.status >= 400)
+    return result
+
+# Function to send a request through the HTTP/2 client or the urllib3 pools
+def _open(client, method, url, headers):
+    if client is not None:
+        response = client.send(client.build_request(method, url, headers=headers), stream=True)
+        return UpstreamResponse(
+            response.status_code, response.headers,
+            lambda chunk_size: response.iter_bytes(chunk_size),
+            lambda consumed: response.close(), response.http_version)
+
+    response = get_pool_manager().request(method, url, headers=headers, preload_content=False)
+    return UpstreamResponse(
+        response.status, response.headers,
+        lambda chunk_size: response.stream(chunk_size),
+        lambda consumed: _release_urllib3(response, consumed), 'HTTP/1.1')
+
+# Function to fetch a whole (small) upstream resource
+def fetch(url, headers=None, method='GET'):
+    with open_url(url, headers=headers, method=method) as response:
+        return response.status, response.headers, response.read()
+
+# Function to collect pool usage metrics
+def get_stats():
+    pools = {}
+    manager = _pool_manager
+    if manager is not None:
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{key.key_scheme}://{key.key_host}:{key.key_port}"] = {
+                "requests": pool.num_requests,
+                "connections_opened": pool.num_connections,
+                "connections_reused": max(pool.num_requests - pool.num_connections, 0),
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn) if pool.pool else 0,
+            }
+
+    with _stats_lock:
+        hosts = {host: dict(stats) for host, stats in _host_stats.items()}
+    with _dns_lock:
+        dns = dict(_dns_stats, entries=len(_dns_cache), ttl=DNS_CACHE_TTL)
+
+    return {
+        "http2": get_http2_client() is not None,
+        "pool_maxsize": POOL_MAXSIZE,
+        "pools": pools,
+        "hosts": hosts,
+        "dns_cache": dns,
+    }
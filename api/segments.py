@@ -0,0 +1,281 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit
+
+import net
+import tracing
+
+# Segmented download engine for HLS/DASH formats and large progressive files.
+# Segments (or byte ranges) are fetched concurrently with a per-host connection
+# limit, retried individually and handed back in order through a bounded reorder
+# buffer, so memory use stays at roughly MAX_BUFFERED_SEGMENTS segments.
+
+SEGMENT_WORKERS = int(os.environ.get('SEGMENT_WORKERS', 8))
+PER_HOST_CONNECTIONS = int(os.environ.get('SEGMENT_PER_HOST_CONNECTIONS', 4))
+MAX_BUFFERED_SEGMENTS = int(os.environ.get('SEGMENT_MAX_BUFFERED', 16))
+RANGE_SEGMENT_SIZE = int(os.environ.get('SEGMENT_RANGE_SIZE', 4 * 1024 * 1024))
+SEGMENT_RETRIES = 3
+
+HLS_PROTOCOLS = ('m3u8', 'm3u8_native')
+DASH_PROTOCOLS = ('http_dash_segments', 'http_dash_segments_generator')
+HTTP_PROTOCOLS = ('http', 'https')
+
+CONTENT_RANGE_RE = re.compile(r'bytes\s+\d+-\d+/(\d+)')
+ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+_totals = {'downloads': 0, 'bytes': 0, 'seconds': 0.0, 'segments': 0, 'retries': 0, 'failures': 0}
+_totals_lock = threading.Lock()
+
+
+class SegmentError(Exception):
+    pass
+
+
+# Function to get the connection limiter for an upstream host (shared by all downloads)
+def host_limit(url):
+    host = urlsplit(url).hostname or ''
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(PER_HOST_CONNECTIONS)
+        return _host_limits[host]
+
+# Function to find the total size of a resource and whether it supports range requests
+def probe_size(url, headers=None):
+    with net.open_url(url, headers=dict(headers or {}, Range='bytes=0-0')) as response:
+        if response.status == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get('content-range', ''))
+            if match:
+                return int(match.group(1)), True
+        if response.status >= 400:
+            raise SegmentError(f"Upstream returned HTTP {response.status}")
+        length = response.headers.get('content-length')
+        return (int(length) if length else None), False
+
+# Function to parse an HLS attribute list like 'METHOD=AES-128,URI="key.bin"'
+def parse_attributes(value):
+    return {key: val.strip('"') for key, val in ATTRIBUTE_RE.findall(value)}
+
+# Function to parse an HLS byte range like "1000@2000" into (start, end)
+def parse_byte_range(value, previous_end):
+    length, _, offset = value.partition('@')
+    start = int(offset) if offset else previous_end
+    return start, start + int(length) - 1
+
+# Function to build the segment list of an HLS media playlist
+def hls_segments(playlist_url, headers=None):
+    status, _, body = net.fetch(playlist_url, headers=headers)
+    if status >= 400:
+        raise SegmentError(f"Could not fetch HLS playlist: HTTP {status}")
+    lines = body.decode('utf-8', errors='replace').splitlines()
+
+    # Master playlist: follow the highest bandwidth variant
+    variants = []
+    for i, line in enumerate(lines):
+        if line.startswith('#EXT-X-STREAM-INF:') and i + 1 < len(lines):
+            bandwidth = int(parse_attributes(line.split(':', 1)[1]).get('BANDWIDTH', 0) or 0)
+            variants.append((bandwidth, urljoin(playlist_url, lines[i + 1].strip())))
+    if variants:
+        return hls_segments(max(variants)[1], headers)
+
+    segments = []
+    byte_range = None
+    range_end = {}
+    for line in lines:
+        line = line.strip()
+        if line.startswith('#EXT-X-KEY:'):
+            if parse_attributes(line.split(':', 1)[1]).get('METHOD', 'NONE') != 'NONE':
+                raise SegmentError("Encrypted HLS streams are not supported")
+        elif line.startswith('#EXT-X-MAP:'):
+            attributes = parse_attributes(line.split(':', 1)[1])
+            segment = {'url': urljoin(playlist_url, attributes['URI']), 'init': True}
+            if 'BYTERANGE' in attributes:
+                segment['start'], segment['end'] = parse_byte_range(attributes['BYTERANGE'], 0)
+            segments.append(segment)
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            byte_range = line.split(':', 1)[1]
+        elif line and not line.startswith('#'):
+            segment = {'url': urljoin(playlist_url, line)}
+            if byte_range:
+                segment['start'], segment['end'] = parse_byte_range(byte_range, range_end.get(segment['url'], 0))
+                range_end[segment['url']] = segment['end'] + 1
+                byte_range = None
+            segments.append(segment)
+
+    if not segments:
+        raise SegmentError("HLS playlist has no segments")
+    return segments
+
+# Function to build the segment list of a DASH format from yt-dlp's fragment list
+def dash_segments(format):
+    base_url = format.get('fragment_base_url')
+    segments = []
+    for fragment in format.get('fragments') or []:
+        url = fragment.get('url') or urljoin(base_url, fragment['path'])
+        segments.append({'url': url})
+    if not segments:
+        raise SegmentError("DASH format has no fragments")
+    return segments
+
+# Function to split a progressive file into byte-range segments
+def range_segments(url, headers=None, segment_size=RANGE_SEGMENT_SIZE):
+    total, ranges_supported = probe_size(url, headers)
+    if not ranges_supported or not total or total <= segment_size:
+        # Fetched as one streamed request instead of being buffered whole
+        return [{'url': url, 'stream': True, 'size': total}]
+    return [
+        {'url': url, 'start': start, 'end': min(start + segment_size, total) - 1}
+        for start in range(0, total, segment_size)
+    ]
+
+# Function to build the segment list for a yt-dlp format
+def segments_for_format(format):
+    protocol = format.get('protocol', 'https')
+    headers = format.get('http_headers')
+    if protocol in HLS_PROTOCOLS:
+        return hls_segments(format['url'], headers)
+    if protocol in DASH_PROTOCOLS:
+        return dash_segments(format)
+    if protocol in HTTP_PROTOCOLS:
+        return range_segments(format['url'], headers)
+    raise SegmentError(f"Unsupported protocol '{protocol}'")
+
+# Function to aggregate throughput of finished downloads
+def get_stats():
+    with _totals_lock:
+        totals = dict(_totals)
+    totals['average_mbps'] = round(totals['bytes'] * 8 / totals['seconds'] / 1e6, 2) if totals['seconds'] else 0
+    return totals
+
+
+# Downloads a list of segments concurrently and yields their bytes in order
+class SegmentedDownloader:
+    def __init__(self, segments, headers=None, workers=SEGMENT_WORKERS,
+                 max_buffered=MAX_BUFFERED_SEGMENTS, retries=SEGMENT_RETRIES):
+        self.segments = segments
+        self.headers = dict(headers or {})
+        self.workers = max(1, min(workers, len(segments)))
+        self.max_buffered = max(max_buffered, self.workers)
+        self.retries = retries
+        self.bytes_done = 0
+        self.segments_done = 0
+        self.retry_count = 0
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+
+    def _fetch(self, segment):
+        headers = dict(self.headers)
+        ranged = 'start' in segment
+        if ranged:
+            headers['Range'] = f"bytes={segment['start']}-{segment['end']}"
+
+        for attempt in range(self.retries):
+            try:
+                with host_limit(segment['url']):
+                    with net.open_url(segment['url'], headers=headers) as response:
+                        if response.status != (206 if ranged else 200):
+                            raise SegmentError(f"Segment request returned HTTP {response.status}")
+                        data = response.read()
+                if ranged and len(data) != segment['end'] - segment['start'] + 1:
+                    raise SegmentError(f"Incomplete segment: got {len(data)} bytes")
+                with self._lock:
+                    self.bytes_done += len(data)
+                    self.segments_done += 1
+                return data
+            except Exception:
+                if attempt == self.retries - 1:
+                    raise
+                with self._lock:
+                    self.retry_count += 1
+                time.sleep(0.5 * 2 ** attempt)
+
+    def _stream(self, segment):
+        # The host slot only covers opening the request. The body is read at the client's
+        # pace, so holding the slot across yields would let slow clients stall the host.
+        with host_limit(segment['url']):
+            response = net.open_url(segment['url'], headers=self.headers)
+        with response:
+            if response.status != 200:
+                raise SegmentError(f"Request returned HTTP {response.status}")
+            for chunk in response.iter_content(256 * 1024):
+                with self._lock:
+                    self.bytes_done += len(chunk)
+                yield chunk
+        with self._lock:
+            self.segments_done += 1
+
+    def __iter__(self):
+        self.started_at = time.time()
+        if len(self.segments) == 1 and self.segments[0].get('stream'):
+            completed = False
+            try:
+                yield from self._stream(self.segments[0])
+                completed = True
+            finally:
+                self.finished_at = time.time()
+                self._record(completed)
+            return
+
+        executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='segment')
+        # Segment requests show up in the trace (and profile) of the request that started the download
+        fetch = tracing.propagate(self._fetch)
+        # Reorder buffer: futures in segment order, at most max_buffered fetched or in flight
+        pending = deque()
+        remaining = iter(self.segments)
+        completed = False
+        try:
+            while True:
+                while len(pending) < self.max_buffered:
+                    segment = next(remaining, None)
+                    if segment is None:
+                        break
+                    pending.append(executor.submit(fetch, segment))
+                if not pending:
+                    break
+                yield pending.popleft().result()
+            completed = True
+        finally:
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=False)
+            self.finished_at = time.time()
+            self._record(completed)
+
+    def _record(self, completed):
+        with _totals_lock:
+            _totals['downloads'] += 1
+            _totals['bytes'] += self.bytes_done
+            _totals['seconds'] += self.elapsed
+            _totals['segments'] += self.segments_done
+            _totals['retries'] += self.retry_count
+            if not completed:
+                _totals['failures'] += 1
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    @property
+    def throughput(self):
+        return self.bytes_done / self.elapsed if self.elapsed else 0.0
+
+    # Function to write all segments to a file, reporting progress as a 0-1 fraction
+    def download_to_file(self, path, on_progress=None):
+        total_size = self.segments[0].get('size') if len(self.segments) == 1 else None
+        with open(path, 'wb') as output:
+            for index, data in enumerate(self, 1):
+                output.write(data)
+                if on_progress and total_size:
+                    on_progress(min(self.bytes_done / total_size, 1.0))
+                elif on_progress:
+                    on_progress(index / len(self.segments))
+        return self.bytes_done
@@ -0,0 +1,314 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlsplit, unquote
+
+# Shared state (extraction cache, single-flight locks, job results, rate limit
+# counters) lives behind a small backend interface so that several API nodes can
+# share it. STATE_BACKEND_URL selects the implementation:
+#   memory://                  - in-process (default, one node)
+#   redis://[:password@]host:port/db - any server speaking the Redis protocol
+STATE_BACKEND_URL = os.environ.get('STATE_BACKEND_URL', 'memory://')
+STATE_KEY_PREFIX = os.environ.get('STATE_KEY_PREFIX', 'video-downloader:')
+STATE_MEMORY_MAX_ENTRIES = int(os.environ.get('STATE_MEMORY_MAX_ENTRIES', 10000))
+# Key prefixes of cache entries, the only ones the in-memory backend evicts when full
+STATE_MEMORY_CACHE_PREFIXES = ('info:', 'negative:', 'negative-hits:', 'subtitles:')
+# How often (seconds) the in-memory backend sweeps out expired entries on writes
+STATE_MEMORY_PURGE_INTERVAL = float(os.environ.get('STATE_MEMORY_PURGE_INTERVAL', 30))
+
+
+# Raised for error replies and when the backend can't be reached
+class StateBackendError(Exception):
+    pass
+
+
+# Base class for state backends. Values are JSON-serializable objects and
+# ttl arguments are in seconds (None means no expiry).
+class StateBackend:
+    name = 'base'
+
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, ttl=None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    # Remaining lifetime of a key in seconds, or None if it is missing or has no expiry
+    def ttl(self, key):
+        raise NotImplementedError
+
+    # Keys starting with prefix
+    def scan(self, prefix):
+        raise NotImplementedError
+
+    # Take a lock that expires after ttl seconds; returns a release token or None if held
+    def acquire_lock(self, name, ttl):
+        raise NotImplementedError
+
+    def release_lock(self, name, token):
+        raise NotImplementedError
+
+    # Increment a counter, starting a new ttl window when it is created
+    def incr(self, key, ttl):
+        raise NotImplementedError
+
+
+# In-process backend. Values are stored as-is, so callers must treat them as read-only.
+# Only cache entries (keys starting with one of cache_prefixes) count towards max_entries
+# and are evicted oldest first; locks, counters and job records are kept until they expire.
+class InMemoryBackend(StateBackend):
+    name = 'memory'
+
+    def __init__(self, max_entries=STATE_MEMORY_MAX_ENTRIES, purge_interval=STATE_MEMORY_PURGE_INTERVAL,
+                 cache_prefixes=STATE_MEMORY_CACHE_PREFIXES):
+        self.max_entries = max_entries
+        self.purge_interval = purge_interval
+        self.cache_prefixes = tuple(cache_prefixes)
+        self._cache = OrderedDict()
+        self._data = {}
+        self._lock = threading.Lock()
+        self._next_purge = 0
+
+    def _table(self, key):
+        return self._cache if key.startswith(self.cache_prefixes) else self._data
+
+    def _live_entry(self, key, now):
+        table = self._table(key)
+        entry = table.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= now:
+            del table[key]
+            return None
+        return entry
+
+    # Function to drop every expired entry, not just the ones read again
+    def _purge_expired(self, now):
+        self._next_purge = now + self.purge_interval
+        for table in (self._cache, self._data):
+            for key in [key for key, entry in table.items() if entry[0] is not None and entry[0] <= now]:
+                del table[key]
+
+    def _store(self, key, value, ttl, now):
+        if now >= self._next_purge:
+            self._purge_expired(now)
+        table = self._table(key)
+        table.pop(key, None)
+        table[key] = (now + ttl if ttl else None, value)
+        # Evict the oldest cache entries once the cache is full
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._live_entry(key, time.time())
+            return entry[1] if entry else None
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._store(key, value, ttl, time.time())
+
+    def delete(self, key):
+        with self._lock:
+            self._table(key).pop(key, None)
+
+    def ttl(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is None or entry[0] is None:
+                return None
+            return entry[0] - now
+
+    def scan(self, prefix):
+        now = time.time()
+        with self._lock:
+            keys = list(self._cache) + list(self._data)
+            return [key for key in keys if key.startswith(prefix) and self._live_entry(key, now)]
+
+    def acquire_lock(self, name, ttl):
+        now = time.time()
+        with self._lock:
+            if self._live_entry('lock:' + name, now):
+                return None
+            token = uuid.uuid4().hex
+            self._store('lock:' + name, token, ttl, now)
+            return token
+
+    def release_lock(self, name, token):
+        with self._lock:
+            entry = self._live_entry('lock:' + name, time.time())
+            if entry and entry[1] == token:
+                del self._data['lock:' + name]
+
+    def incr(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            entry = self._live_entry(key, now)
+            if entry is None:
+                self._store(key, 1, ttl, now)
+                return 1
+            self._table(key)[key] = (entry[0], entry[1] + 1)
+            return entry[1] + 1
+
+
+# Backend for Redis (or any server implementing the Redis protocol), using one
+# connection per thread. Keys are namespaced with STATE_KEY_PREFIX.
+class RedisBackend(StateBackend):
+    name = 'redis'
+
+    RELEASE_LOCK_SCRIPT = (
+        "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+        "return redis.call('DEL', KEYS[1]) else return 0 end"
+    )
+    INCR_SCRIPT = (
+        "local value = redis.call('INCR', KEYS[1]) "
+        "if value == 1 then redis.call('PEXPIRE', KEYS[1], ARGV[1]) end "
+        "return value"
+    )
+
+    def __init__(self, url, prefix=STATE_KEY_PREFIX, timeout=5.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname or 'localhost'
+        self.port = parts.port or 6379
+        self.password = unquote(parts.password) if parts.password else None
+        self.username = unquote(parts.username) if parts.username else None
+        self.db = int(parts.path.lstrip('/') or 0)
+        self.prefix = prefix
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._local.sock = sock
+        self._local.reader = sock.makefile('rb')
+        try:
+            if self.password:
+                if self.username:
+                    self._execute('AUTH', self.username, self.password)
+                else:
+                    self._execute('AUTH', self.password)
+            if self.db:
+                self._execute('SELECT', self.db)
+        except StateBackendError:
+            # Don't keep a connection that isn't authenticated or on the right database
+            self._disconnect()
+            raise
+
+    def _disconnect(self):
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self._local.sock = None
+
+    def _send(self, *args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        self._local.sock.sendall(b''.join(parts))
+
+    def _execute(self, *args):
+        self._send(*args)
+        return self._read_reply()
+
+    def _read_reply(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by state backend')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload.decode('utf-8')
+        if kind == b'-':
+            raise StateBackendError(payload.decode('utf-8'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = self._local.reader.read(length + 2)
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply() for _ in range(length)]
+        raise StateBackendError(f'Unexpected reply from state backend: {line!r}')
+
+    # Function to run a command, reconnecting once if the connection went away.
+    # Commands that aren't idempotent (SET NX, INCR) are only re-sent when the first
+    # attempt failed before it was sent, since a lost reply doesn't mean a lost write.
+    def command(self, *args, idempotent=True):
+        for attempt in range(2):
+            sent = False
+            try:
+                if getattr(self._local, 'sock', None) is None:
+                    self._connect()
+                self._send(*args)
+                sent = True
+                return self._read_reply()
+            except (ConnectionError, OSError) as e:
+                self._disconnect()
+                if attempt or (sent and not idempotent):
+                    raise StateBackendError(f'State backend unavailable: {e}') from e
+
+    def get(self, key):
+        value = self.command('GET', self.prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        data = json.dumps(value, separators=(',', ':'))
+        if ttl:
+            self.command('SET', self.prefix + key, data, 'PX', int(ttl * 1000))
+        else:
+            self.command('SET', self.prefix + key, data)
+
+    def delete(self, key):
+        self.command('DEL', self.prefix + key)
+
+    def ttl(self, key):
+        remaining = self.command('PTTL', self.prefix + key)
+        return remaining / 1000 if remaining >= 0 else None
+
+    def scan(self, prefix):
+        keys = []
+        cursor = '0'
+        while True:
+            cursor, batch = self.command('SCAN', cursor, 'MATCH', self.prefix + prefix + '*', 'COUNT', 500)
+            keys.extend(k.decode('utf-8')[len(self.prefix):] for k in batch)
+            cursor = cursor.decode('utf-8') if isinstance(cursor, bytes) else cursor
+            if cursor == '0':
+                return keys
+
+    def acquire_lock(self, name, ttl):
+        token = uuid.uuid4().hex
+        reply = self.command('SET', self.prefix + 'lock:' + name, token, 'NX', 'PX', int(ttl * 1000),
+                             idempotent=False)
+        return token if reply == 'OK' else None
+
+    def release_lock(self, name, token):
+        self.command('EVAL', self.RELEASE_LOCK_SCRIPT, 1, self.prefix + 'lock:' + name, token)
+
+    def incr(self, key, ttl):
+        return self.command('EVAL', self.INCR_SCRIPT, 1, self.prefix + key, int(ttl * 1000), idempotent=False)
+
+
+# Function to create the backend for a STATE_BACKEND_URL
+def create_backend(url):
+    scheme = urlsplit(url).scheme
+    if scheme in ('', 'memory'):
+        return InMemoryBackend()
+    if scheme in ('redis', 'tcp'):
+        return RedisBackend(url)
+    raise ValueError(f"Unsupported state backend URL: {url}")
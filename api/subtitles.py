@@ -0,0 +1,129 @@
+import codecs
+import json
+import re
+
+# Streaming subtitle conversion between WebVTT, SRT and JSON cues. Everything
+# works on iterators of chunks, so a track is never held in memory as a whole.
+
+SUBTITLE_FORMATS = {
+    'vtt': 'text/vtt; charset=utf-8',
+    'srt': 'application/x-subrip; charset=utf-8',
+    'json': 'application/json',
+}
+
+TIMING_RE = re.compile(
+    r'^\s*((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})\s+-->\s+((?:\d+:)?\d{1,2}:\d{2}[.,]\d{1,3})'
+)
+TAG_RE = re.compile(r'<[^>]*>')
+
+# Function to split byte chunks into decoded text lines
+def iter_lines(chunks):
+    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+    pending = ''
+    for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.splitlines(keepends=True)
+        # Keep a trailing partial line (or a lone '\r' that may precede '\n') for the next chunk
+        pending = lines.pop() if lines and not lines[-1].endswith('\n') else ''
+        for line in lines:
+            yield line.rstrip('\r\n')
+    pending += decoder.decode(b'', final=True)
+    for line in pending.splitlines():
+        yield line
+
+# Function to parse a timestamp like "01:02:03.456", "02:03,456" or "1:02:03.4"
+def parse_timestamp(value):
+    value = value.replace(',', '.')
+    parts = value.split(':')
+    seconds = float(parts[-1])
+    for i, part in enumerate(reversed(parts[:-1])):
+        seconds += int(part) * 60 ** (i + 1)
+    return seconds
+
+# Function to format seconds as a timestamp with the given millisecond separator
+def format_timestamp(seconds, separator):
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600000)
+    minutes, millis = divmod(millis, 60000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d}{separator}{millis:03d}"
+
+# Function to parse WebVTT or SRT lines into cues ({"start", "end", "text"})
+def parse_cues(lines):
+    cue = None
+    skipping_block = False
+    for line in lines:
+        if cue is not None:
+            if line.strip():
+                cue['lines'].append(line)
+                continue
+            yield finish_cue(cue)
+            cue = None
+            continue
+
+        if skipping_block:
+            # NOTE, STYLE and REGION blocks run until the next blank line
+            skipping_block = bool(line.strip())
+            continue
+
+        match = TIMING_RE.match(line)
+        if match:
+            cue = {'start': parse_timestamp(match.group(1)), 'end': parse_timestamp(match.group(2)), 'lines': []}
+        elif line.startswith(('NOTE', 'STYLE', 'REGION')):
+            skipping_block = True
+        # Anything else (WEBVTT header, cue identifiers, SRT counters) is skipped
+
+    if cue is not None:
+        yield finish_cue(cue)
+
+# Function to turn collected cue lines into plain text
+def finish_cue(cue):
+    text = '\n'.join(TAG_RE.sub('', line).strip() for line in cue['lines'])
+    return {'start': cue['start'], 'end': cue['end'], 'text': text.strip()}
+
+# Function to write cues as SRT
+def write_srt(cues):
+    for index, cue in enumerate(cues, 1):
+        yield (f"{index}\n{format_timestamp(cue['start'], ',')} --> "
+               f"{format_timestamp(cue['end'], ',')}\n{cue['text']}\n\n")
+
+# Function to write cues as WebVTT
+def write_vtt(cues):
+    yield 'WEBVTT\n\n'
+    for cue in cues:
+        yield (f"{format_timestamp(cue['start'], '.')} --> "
+               f"{format_timestamp(cue['end'], '.')}\n{cue['text']}\n\n")
+
+# Function to write cues as a JSON array
+def write_json(cues):
+    separator = '[\n'
+    for cue in cues:
+        yield separator + json.dumps({
+            "start": round(cue['start'], 3),
+            "end": round(cue['end'], 3),
+            "text": cue['text']
+        }, ensure_ascii=False)
+        separator = ',\n'
+    yield '\n]\n' if separator != '[\n' else '[]\n'
+
+WRITERS = {
+    'vtt': write_vtt,
+    'srt': write_srt,
+    'json': write_json,
+}
+
+# Function to convert a stream of subtitle bytes (source_ext: vtt or srt) into another format
+def convert(chunks, source_ext, target_format):
+    if source_ext == target_format:
+        # Passed through, but re-encoded so non-UTF-8 tracks match the declared charset
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            if text:
+                yield text.encode('utf-8')
+        text = decoder.decode(b'', final=True)
+        if text:
+            yield text.encode('utf-8')
+        return
+    for text in WRITERS[target_format](parse_cues(iter_lines(chunks))):
+        yield text.encode('utf-8')
@@ -0,0 +1,213 @@
+import threading
+
+import pytest
+
+pytest.importorskip('urllib3')
+pytest.importorskip('certifi')
+
+import segments  # noqa: E402
+
+
+# Stand-in for net.UpstreamResponse
+class FakeResponse:
+    def __init__(self, status, body=b'', headers=None, chunk_size=None):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size=64 * 1024):
+        size = self.chunk_size or chunk_size
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+    def read(self):
+        return self.body
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@pytest.fixture(autouse=True)
+def isolated_downloads(monkeypatch):
+    monkeypatch.setattr(segments.time, 'sleep', lambda seconds: None)
+    monkeypatch.setattr(segments, '_host_limits', {})
+
+
+def serve_playlists(monkeypatch, playlists):
+    def fetch(url, headers=None, method='GET'):
+        if url not in playlists:
+            return 404, {}, b''
+        return 200, {}, playlists[url].encode('utf-8')
+    monkeypatch.setattr(segments.net, 'fetch', fetch)
+
+
+def test_hls_byte_ranges_and_map(monkeypatch):
+    serve_playlists(monkeypatch, {'https://cdn.test/v/media.m3u8': (
+        '#EXTM3U\n'
+        '#EXT-X-MAP:URI="init.mp4",BYTERANGE="720@0"\n'
+        '#EXTINF:4,\n'
+        '#EXT-X-BYTERANGE:1000@720\n'
+        'main.mp4\n'
+        '#EXTINF:4,\n'
+        '#EXT-X-BYTERANGE:500\n'
+        'main.mp4\n'
+        '#EXTINF:4,\n'
+        'https://other.test/seg3.mp4\n'
+        '#EXT-X-ENDLIST\n'
+    )})
+
+    assert segments.hls_segments('https://cdn.test/v/media.m3u8') == [
+        {'url': 'https://cdn.test/v/init.mp4', 'init': True, 'start': 0, 'end': 719},
+        # An offset-less range continues where the previous range of the same URI ended
+        {'url': 'https://cdn.test/v/main.mp4', 'start': 720, 'end': 1719},
+        {'url': 'https://cdn.test/v/main.mp4', 'start': 1720, 'end': 2219},
+        {'url': 'https://other.test/seg3.mp4'},
+    ]
+
+
+def test_hls_master_playlist_follows_highest_bandwidth(monkeypatch):
+    serve_playlists(monkeypatch, {
+        'https://cdn.test/master.m3u8': (
+            '#EXTM3U\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=800000,CODECS="avc1,mp4a"\n'
+            'low/index.m3u8\n'
+            '#EXT-X-STREAM-INF:BANDWIDTH=2400000,CODECS="avc1,mp4a"\n'
+            'high/index.m3u8\n'
+        ),
+        'https://cdn.test/high/index.m3u8': '#EXTM3U\n#EXTINF:4,\n0.ts\n#EXTINF:4,\n1.ts\n',
+    })
+
+    assert segments.hls_segments('https://cdn.test/master.m3u8') == [
+        {'url': 'https://cdn.test/high/0.ts'},
+        {'url': 'https://cdn.test/high/1.ts'},
+    ]
+
+
+def test_hls_rejects_encrypted_streams(monkeypatch):
+    serve_playlists(monkeypatch, {'https://cdn.test/media.m3u8': (
+        '#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key.bin"\n#EXTINF:4,\n0.ts\n'
+    )})
+    with pytest.raises(segments.SegmentError):
+        segments.hls_segments('https://cdn.test/media.m3u8')
+
+
+def test_range_segments_split_by_size(monkeypatch):
+    monkeypatch.setattr(segments.net, 'open_url', lambda url, headers=None: FakeResponse(
+        206, headers={'content-range': 'bytes 0-0/2500'}))
+
+    assert segments.range_segments('https://cdn.test/v.mp4', segment_size=1000) == [
+        {'url': 'https://cdn.test/v.mp4', 'start': 0, 'end': 999},
+        {'url': 'https://cdn.test/v.mp4', 'start': 1000, 'end': 1999},
+        {'url': 'https://cdn.test/v.mp4', 'start': 2000, 'end': 2499},
+    ]
+
+
+def test_range_segments_without_range_support_stream(monkeypatch):
+    monkeypatch.setattr(segments.net, 'open_url', lambda url, headers=None: FakeResponse(
+        200, headers={'content-length': '2500'}))
+
+    assert segments.range_segments('https://cdn.test/v.mp4', segment_size=1000) == [
+        {'url': 'https://cdn.test/v.mp4', 'stream': True, 'size': 2500},
+    ]
+
+
+def test_segments_are_yielded_in_order_when_completed_out_of_order(monkeypatch):
+    count = 6
+    release = {i: threading.Event() for i in range(count)}
+    finished = []
+
+    # Segments finish in reverse order: each one waits for the one after it
+    # (one host per segment, so the per-host limit doesn't hold any of them back)
+    def open_url(url, headers=None):
+        index = int(url.rsplit('/', 1)[1])
+        if index + 1 < count:
+            release[index + 1].wait(5)
+        finished.append(index)
+        release[index].set()
+        return FakeResponse(200, f'<{index}>'.encode())
+
+    monkeypatch.setattr(segments.net, 'open_url', open_url)
+    downloader = segments.SegmentedDownloader(
+        [{'url': f'https://cdn{i}.test/{i}'} for i in range(count)], workers=count, max_buffered=count)
+
+    assert list(downloader) == [f'<{i}>'.encode() for i in range(count)]
+    assert finished == list(reversed(range(count)))
+    assert downloader.segments_done == count
+
+
+def test_failed_segment_is_retried(monkeypatch):
+    attempts = {}
+
+    def open_url(url, headers=None):
+        attempts[url] = attempts.get(url, 0) + 1
+        if url.endswith('/1') and attempts[url] == 1:
+            return FakeResponse(503)
+        if url.endswith('/2') and attempts[url] < 3:
+            raise ConnectionError('reset')
+        return FakeResponse(200, url[-1].encode())
+
+    monkeypatch.setattr(segments.net, 'open_url', open_url)
+    downloader = segments.SegmentedDownloader([{'url': f'https://cdn.test/{i}'} for i in range(3)], retries=3)
+
+    assert b''.join(downloader) == b'012'
+    assert attempts == {'https://cdn.test/0': 1, 'https://cdn.test/1': 2, 'https://cdn.test/2': 3}
+    assert downloader.retry_count == 3
+
+
+def test_segment_fails_after_retries(monkeypatch):
+    monkeypatch.setattr(segments.net, 'open_url', lambda url, headers=None: FakeResponse(404))
+    downloader = segments.SegmentedDownloader([{'url': 'https://cdn.test/0'}], retries=2)
+
+    with pytest.raises(segments.SegmentError):
+        list(downloader)
+    assert downloader.retry_count == 1
+
+
+def test_ranged_segment_checks_length(monkeypatch):
+    monkeypatch.setattr(segments.net, 'open_url', lambda url, headers=None: FakeResponse(206, b'short'))
+    downloader = segments.SegmentedDownloader([{'url': 'https://cdn.test/v', 'start': 0, 'end': 99}], retries=1)
+
+    with pytest.raises(segments.SegmentError, match='Incomplete segment'):
+        list(downloader)
+
+
+def test_reorder_buffer_is_bounded(monkeypatch):
+    in_flight = []
+    lock = threading.Lock()
+
+    def open_url(url, headers=None):
+        with lock:
+            in_flight.append(url)
+        return FakeResponse(200, b'x')
+
+    monkeypatch.setattr(segments.net, 'open_url', open_url)
+    downloader = segments.SegmentedDownloader(
+        [{'url': f'https://cdn.test/{i}'} for i in range(50)], workers=2, max_buffered=4)
+
+    iterator = iter(downloader)
+    next(iterator)
+    # Nothing beyond the buffer is requested while the consumer is paused
+    assert len(in_flight) <= 5
+    assert len(list(iterator)) == 49
+
+
+def test_streamed_download_does_not_hold_the_host_slot(monkeypatch):
+    monkeypatch.setattr(segments, 'PER_HOST_CONNECTIONS', 1)
+    monkeypatch.setattr(segments.net, 'open_url', lambda url, headers=None: FakeResponse(
+        200, b'abcdef', chunk_size=2))
+
+    slow_client = iter(segments.SegmentedDownloader([{'url': 'https://cdn.test/big', 'stream': True}]))
+    assert next(slow_client) == b'ab'
+
+    # Another download from the same host isn't blocked while the first one is paused
+    other = segments.SegmentedDownloader([{'url': 'https://cdn.test/other', 'stream': True}])
+    assert b''.join(other) == b'abcdef'
+    assert b''.join(slow_client) == b'cdef'
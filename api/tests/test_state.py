@@ -0,0 +1,156 @@
+import socket
+import threading
+import time
+
+import pytest
+
+import state
+
+
+# RedisBackend is tested against fakeredis' TCP server, a local stand-in speaking the
+# Redis protocol (EVAL needs its Lua support). Install with: pip install -r requirements-dev.txt
+@pytest.fixture
+def redis_url():
+    fakeredis = pytest.importorskip('fakeredis')
+    pytest.importorskip('lupa')
+    server = fakeredis.TcpFakeServer(('127.0.0.1', 0), server_type='redis')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"redis://127.0.0.1:{server.server_address[1]}/0"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def backend(redis_url):
+    backend = state.RedisBackend(redis_url, prefix='test:')
+    yield backend
+    backend._disconnect()
+
+
+def test_create_backend_picks_redis(redis_url):
+    assert isinstance(state.create_backend(redis_url), state.RedisBackend)
+
+
+def test_get_set_delete_with_ttl(backend):
+    backend.set('info:a', {'title': 'A', 'formats': [1, 2]}, 60)
+    assert backend.get('info:a') == {'title': 'A', 'formats': [1, 2]}
+    assert 0 < backend.ttl('info:a') <= 60
+
+    backend.set('job:b', {'status': 'done'})
+    assert backend.ttl('job:b') is None
+
+    backend.delete('info:a')
+    assert backend.get('info:a') is None
+    assert backend.ttl('info:a') is None
+
+
+def test_set_expires(backend):
+    backend.set('info:short', 1, 0.05)
+    time.sleep(0.1)
+    assert backend.get('info:short') is None
+
+
+def test_scan_with_prefix(backend):
+    for i in range(1200):
+        backend.set(f'negative:url-{i}', i, 60)
+    backend.set('info:other', 1, 60)
+    # Keys outside the backend's own namespace are ignored
+    backend.command('SET', 'negative:foreign', '1')
+
+    keys = backend.scan('negative:')
+    assert len(keys) == 1200
+    assert set(keys) == {f'negative:url-{i}' for i in range(1200)}
+
+
+def test_lock_acquire_release(backend):
+    token = backend.acquire_lock('extract:a', 60)
+    assert token is not None
+    assert backend.acquire_lock('extract:a', 60) is None
+
+    # Only the holder's token releases the lock
+    backend.release_lock('extract:a', 'not-the-token')
+    assert backend.acquire_lock('extract:a', 60) is None
+    backend.release_lock('extract:a', token)
+
+    second = backend.acquire_lock('extract:a', 60)
+    assert second is not None and second != token
+
+
+def test_lock_expires(backend):
+    assert backend.acquire_lock('extract:a', 0.05) is not None
+    time.sleep(0.1)
+    assert backend.acquire_lock('extract:a', 60) is not None
+
+
+def test_counter_expiry(backend):
+    assert backend.incr('ratelimit:youtube', 0.2) == 1
+    assert backend.incr('ratelimit:youtube', 0.2) == 2
+    # Increments don't extend the window started by the first one
+    assert backend.ttl('ratelimit:youtube') <= 0.2
+    time.sleep(0.3)
+    assert backend.incr('ratelimit:youtube', 0.2) == 1
+
+
+def test_reconnects_after_connection_loss(backend):
+    backend.set('info:a', 1, 60)
+    backend._local.sock.close()
+    assert backend.get('info:a') == 1
+
+
+def test_incr_not_resent_after_lost_reply(backend, monkeypatch):
+    assert backend.incr('ratelimit:youtube', 60) == 1
+    read_reply = backend._read_reply
+    lost = []
+
+    # The server runs the command, but the reply never arrives
+    def lose_first_reply():
+        if not lost:
+            lost.append(read_reply())
+            raise socket.timeout('timed out')
+        return read_reply()
+
+    monkeypatch.setattr(backend, '_read_reply', lose_first_reply)
+    with pytest.raises(state.StateBackendError):
+        backend.incr('ratelimit:youtube', 60)
+    monkeypatch.undo()
+    assert lost == [2]
+    assert backend.incr('ratelimit:youtube', 60) == 3
+
+
+def test_unreachable_server_raises_backend_error():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    backend = state.RedisBackend(f'redis://127.0.0.1:{port}/0', timeout=1)
+    with pytest.raises(state.StateBackendError):
+        backend.get('info:a')
+
+
+def test_memory_backend_only_evicts_cache_entries():
+    backend = state.InMemoryBackend(max_entries=3)
+    token = backend.acquire_lock('extract:a', 60)
+    backend.set('job:b', {'status': 'queued'}, 86400)
+    assert backend.incr('ratelimit:youtube:1', 60) == 1
+    for i in range(5):
+        backend.set(f'info:url-{i}', i, 300)
+
+    assert backend.acquire_lock('extract:a', 60) is None
+    backend.release_lock('extract:a', token)
+    assert backend.acquire_lock('extract:a', 60) is not None
+    assert backend.get('job:b') == {'status': 'queued'}
+    assert backend.incr('ratelimit:youtube:1', 60) == 2
+    # Only the three newest cache entries are kept
+    assert sorted(backend.scan('info:')) == ['info:url-2', 'info:url-3', 'info:url-4']
+
+
+def test_memory_backend_purges_expired_entries():
+    backend = state.InMemoryBackend(purge_interval=0)
+    backend.set('info:a', {'title': 'A'}, 0.05)
+    backend.set('job:b', {'status': 'done'})
+    time.sleep(0.1)
+    # A write to another key sweeps out entries that are never read again
+    backend.set('info:c', 1, 60)
+    assert backend.get('info:c') == 1
+    assert 'info:a' not in backend._cache
+    assert backend.get('job:b') == {'status': 'done'}
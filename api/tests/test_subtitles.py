@@ -0,0 +1,90 @@
+import json
+
+import subtitles
+
+VTT = (
+    'WEBVTT\r\n'
+    '\r\n'
+    'NOTE This block is a comment\r\n'
+    'that spans two lines\r\n'
+    '\r\n'
+    'intro\r\n'
+    '00:00:01.000 --> 00:00:02.500 align:start\r\n'
+    '<v Speaker>Héllo</v>\r\n'
+    'world\r\n'
+    '\r\n'
+    'NOTE another comment\r\n'
+    '\r\n'
+    '01:02:03.040 --> 01:02:04.000\r\n'
+    '日本語\r\n'
+)
+
+SRT = (
+    '1\n'
+    '00:00:01,000 --> 00:00:02,500\n'
+    'Héllo\n'
+    'world\n'
+    '\n'
+    '2\n'
+    '01:02:03,040 --> 01:02:04,000\n'
+    '日本語\n'
+    '\n'
+)
+
+
+# Function to split bytes into chunks of the given size
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def convert(text, source_ext, target_format, chunk_size):
+    chunks = chunked(text.encode('utf-8'), chunk_size)
+    return b''.join(subtitles.convert(iter(chunks), source_ext, target_format)).decode('utf-8')
+
+
+def test_vtt_to_srt_across_chunk_boundaries():
+    # Chunk sizes of 1 and 7 split CRLF pairs and multi-byte characters
+    for chunk_size in (1, 2, 7, 4096):
+        assert convert(VTT, 'vtt', 'srt', chunk_size) == SRT
+
+
+def test_srt_to_vtt():
+    assert convert(SRT, 'srt', 'vtt', 3) == (
+        'WEBVTT\n\n'
+        '00:00:01.000 --> 00:00:02.500\nHéllo\nworld\n\n'
+        '01:02:03.040 --> 01:02:04.000\n日本語\n\n'
+    )
+
+
+def test_vtt_to_json():
+    cues = json.loads(convert(VTT, 'vtt', 'json', 5))
+    assert cues == [
+        {'start': 1.0, 'end': 2.5, 'text': 'Héllo\nworld'},
+        {'start': 3723.04, 'end': 3724.0, 'text': '日本語'},
+    ]
+
+
+def test_json_of_empty_track():
+    assert json.loads(convert('WEBVTT\n\nNOTE nothing here\n', 'vtt', 'json', 4)) == []
+
+
+def test_byte_order_mark_and_last_cue_without_blank_line():
+    data = '﻿1\r\n00:00:00,500 --> 00:00:01,000\r\nlast'
+    assert convert(data, 'srt', 'vtt', 2) == 'WEBVTT\n\n00:00:00.500 --> 00:00:01.000\nlast\n\n'
+
+
+def test_passthrough_reencodes_invalid_utf8():
+    data = '1\n00:00:01,000 --> 00:00:02,000\nCafé\n'.encode('cp1252')
+    output = b''.join(subtitles.convert(iter(chunked(data, 4)), 'srt', 'srt'))
+    assert output.decode('utf-8') == '1\n00:00:01,000 --> 00:00:02,000\nCaf�\n'
+
+
+def test_passthrough_keeps_split_multibyte_characters():
+    data = 'WEBVTT\n\n00:00.000 --> 00:01.000\n日本語\n'.encode('utf-8')
+    assert b''.join(subtitles.convert(iter(chunked(data, 1)), 'vtt', 'vtt')) == data
+
+
+def test_timestamps():
+    assert subtitles.parse_timestamp('1:02:03.4') == 3723.4
+    assert subtitles.parse_timestamp('02:03,456') == 123.456
+    assert subtitles.format_timestamp(3723.04, ',') == '01:02:03,040'
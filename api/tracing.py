@@ -0,0 +1,281 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+# Opt-in request tracing and profiling.
+#
+# Every request gets an X-Request-ID (taken from the request when present). With
+# TRACE_ENABLED=1, or per request with "X-Trace: 1", span logs are written as JSON
+# lines for extraction, yt-dlp HTTP requests and progress hooks, upstream requests,
+# DNS lookups and response shaping. A sampling profiler can be turned on per request
+# with "X-Profile: 1", for a random share of requests (PROFILE_SAMPLE_RATE) or for
+# requests slower than PROFILE_SLOW_MS; it writes collapsed stacks ("a;b;c 12") to
+# PROFILE_DIR, which flamegraph.pl or speedscope turn into flame graphs.
+
+TRACE_ENABLED = os.environ.get('TRACE_ENABLED', '').lower() in ('1', 'true', 'yes')
+PROFILE_SLOW_MS = float(os.environ.get('PROFILE_SLOW_MS', 0))
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(tempfile.gettempdir(), 'video-downloader-profiles'))
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,128}$')
+
+logger = logging.getLogger('video_downloader.trace')
+
+_current = contextvars.ContextVar('video_downloader_trace', default=None)
+_current_span = contextvars.ContextVar('video_downloader_span', default=None)
+
+
+# Per-request tracing state
+class Trace:
+    def __init__(self, request_id, log_spans):
+        self.request_id = request_id
+        self.log_spans = log_spans
+        self.started = time.perf_counter()
+        self.thread_id = threading.get_ident()
+        self.profiled = False
+        self.always_dump_profile = False
+        self.samples = Counter()
+        self.streaming = False
+
+
+# Process-wide sampling profiler. One thread takes a snapshot of all stacks every
+# interval and counts the collapsed stacks of the threads working for profiled
+# requests, so the cost doesn't grow with the number of concurrent requests.
+class SamplingProfiler:
+    def __init__(self, interval):
+        self.interval = interval
+        self._threads = {}
+        self._lock = threading.Lock()
+        self._active = threading.Condition(self._lock)
+        self._thread = None
+
+    # Function to start sampling a thread on behalf of a trace
+    def add_thread(self, thread_id, trace):
+        with self._lock:
+            self._threads[thread_id] = trace
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+                self._thread.start()
+            self._active.notify()
+
+    def remove_thread(self, thread_id):
+        with self._lock:
+            self._threads.pop(thread_id, None)
+
+    # Function to get a copy of a trace's samples so far
+    def collect(self, trace):
+        with self._lock:
+            return Counter(trace.samples)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._threads:
+                    self._active.wait()
+            time.sleep(self.interval)
+
+            with self._lock:
+                threads = dict(self._threads)
+            frames = sys._current_frames()
+            stacks = []
+            for thread_id, trace in threads.items():
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                if stack:
+                    stacks.append((trace, ';'.join(reversed(stack))))
+            del frames
+
+            with self._lock:
+                for trace, stack in stacks:
+                    trace.samples[stack] += 1
+
+
+_profiler = SamplingProfiler(PROFILE_INTERVAL_MS / 1000)
+
+
+# Function to get the current request id (None outside a request)
+def current_request_id():
+    trace = _current.get()
+    return trace.request_id if trace else None
+
+# Function to write a structured trace event for the current request
+def log_event(event, **fields):
+    _log(_current.get(), event, fields)
+
+def _log(trace, event, fields):
+    if trace is None or not trace.log_spans:
+        return
+    logger.info(json.dumps(dict({"event": event, "request_id": trace.request_id}, **fields), default=str))
+
+# Context manager timing a block as a span; the yielded dict can be filled with more fields
+@contextmanager
+def span(name, **fields):
+    trace = _current.get()
+    if trace is None or not trace.log_spans:
+        yield fields
+        return
+
+    # The parent lives in the context, so spans in worker threads nest correctly too
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    started = time.perf_counter()
+    try:
+        yield fields
+    except Exception as e:
+        fields['error'] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        log_event('span', span=name, parent=parent,
+                  offset_ms=round((started - trace.started) * 1000, 2),
+                  duration_ms=round((time.perf_counter() - started) * 1000, 2), **fields)
+
+# Function to wrap a callable so that it runs in the caller's trace context, for work
+# handed to other threads (spans are logged and the thread is profiled with the request)
+def propagate(function):
+    context = contextvars.copy_context()
+    if context.get(_current) is None:
+        return function
+
+    def run(*args, **kwargs):
+        # A context can only be entered by one thread at a time, so each call gets a copy
+        return context.copy().run(_run_traced, function, args, kwargs)
+    return run
+
+def _run_traced(function, args, kwargs):
+    trace = _current.get()
+    if not trace.profiled:
+        return function(*args, **kwargs)
+    thread_id = threading.get_ident()
+    _profiler.add_thread(thread_id, trace)
+    try:
+        return function(*args, **kwargs)
+    finally:
+        _profiler.remove_thread(thread_id)
+
+# Function to start tracing (and possibly profiling) the current request
+def start_request(request_id, trace_requested=False, profile_requested=False):
+    trace = Trace(request_id, TRACE_ENABLED or trace_requested)
+    sampled = PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+    if profile_requested or sampled or PROFILE_SLOW_MS > 0:
+        trace.profiled = True
+        trace.always_dump_profile = profile_requested or sampled
+        _profiler.add_thread(trace.thread_id, trace)
+    _current.set(trace)
+    return trace
+
+# Function to finish a request's trace (the current one by default) and write its profile if needed
+def finish_request(trace=None, **fields):
+    trace = trace or _current.get()
+    if trace is None:
+        return None
+    duration_ms = (time.perf_counter() - trace.started) * 1000
+
+    profile_path = None
+    if trace.profiled:
+        _profiler.remove_thread(trace.thread_id)
+        samples = _profiler.collect(trace)
+        slow = PROFILE_SLOW_MS > 0 and duration_ms >= PROFILE_SLOW_MS
+        if samples and (trace.always_dump_profile or slow):
+            profile_path = write_collapsed(trace.request_id, samples)
+
+    if profile_path and not trace.log_spans:
+        # Saved profiles are always announced, even without span logging
+        logger.info(json.dumps({"event": "profile", "request_id": trace.request_id, "path": profile_path}))
+    _log(trace, 'request', dict(fields, duration_ms=round(duration_ms, 2), profile=profile_path))
+    if _current.get() is trace:
+        _current.set(None)
+    return profile_path
+
+# Function to write collapsed stacks for offline flame graph rendering
+def write_collapsed(request_id, samples):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{int(time.time())}-{request_id}.folded")
+    with open(path, 'w') as output:
+        for stack, count in samples.most_common():
+            output.write(f"{stack} {count}\n")
+    return path
+
+# Function to add span logging to a YoutubeDL instance's HTTP requests and progress hooks
+def instrument_ydl(ydl):
+    urlopen = ydl.urlopen
+
+    def traced_urlopen(req):
+        url = req if isinstance(req, str) else getattr(req, 'url', None) or req.get_full_url()
+        parts = urlsplit(url)
+        with span('ydl.http', method=getattr(req, 'method', None) or 'GET',
+                  host=parts.hostname, path=parts.path[:200]) as fields:
+            response = urlopen(req)
+            fields['status'] = getattr(response, 'status', None)
+            return response
+
+    def progress_hook(progress):
+        # Only state changes; per-chunk "downloading" callbacks would flood the log
+        if progress.get('status') != 'downloading':
+            log_event('ydl.progress', status=progress.get('status'),
+                      downloaded_bytes=progress.get('downloaded_bytes'), elapsed=progress.get('elapsed'))
+
+    ydl.urlopen = traced_urlopen
+    ydl.add_progress_hook(progress_hook)
+    return ydl
+
+# Function to register request-id, tracing and profiling hooks on a Flask app.
+# authorize() decides whether a request may turn on tracing/profiling with headers.
+def install(app, authorize):
+    from flask import request
+
+    if not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+    @app.before_request
+    def start_trace():
+        request_id = request.headers.get(REQUEST_ID_HEADER, '')
+        if not REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        wants_trace = request.headers.get('X-Trace') == '1'
+        wants_profile = request.headers.get('X-Profile') == '1'
+        privileged = (wants_trace or wants_profile) and authorize()
+        start_request(request_id, privileged and wants_trace, privileged and wants_profile)
+
+    @app.after_request
+    def add_request_id(response):
+        trace = _current.get()
+        if trace is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+        fields = {'method': request.method, 'path': request.path, 'status': response.status_code}
+        if response.is_streamed:
+            # Streamed bodies run after the request has returned, so finish once they are sent
+            trace.streaming = True
+            response.call_on_close(lambda: finish_request(trace, **fields))
+        else:
+            finish_request(trace, **fields)
+        return response
+
+    @app.teardown_request
+    def end_trace(exc):
+        # Requests that failed before after_request still need their profiler stopped
+        trace = _current.get()
+        if trace is not None and not trace.streaming:
+            finish_request(trace, method=request.method, path=request.path, error=repr(exc) if exc else None)